@@ -0,0 +1,314 @@
+"""
+Static Assets
+=============
+CSS and static HTML for the web app, minified once per process.
+
+Streamlit re-executes `dnd.py` on every rerun, but imported modules are
+cached, so keeping these strings here means they are built (and shrunk)
+once rather than re-created and re-sent at full size on every run.
+"""
+
+import re
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and collapse whitespace around CSS punctuation."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_html(html: str) -> str:
+    """Collapse whitespace between and inside tags onto a single line.
+    
+    A single line also keeps Markdown from reading indented HTML as a code block.
+    """
+    html = re.sub(r">\s+<", "><", html)
+    return re.sub(r"\s+", " ", html).strip()
+
+
+def _minify_style_block(block: str) -> str:
+    css = block.strip()[len("<style>"):-len("</style>")]
+    return f"<style>{minify_css(css)}</style>"
+
+
+# ===== CUSTOM CSS FOR PASTEL AESTHETIC =====
+CUSTOM_CSS = _minify_style_block("""
+<style>
+    /* Main color palette - Soft Pastels */
+    :root {
+        --pastel-pink: #FFD6E8;
+        --pastel-blue: #C1E7FF;
+        --pastel-purple: #E0BBE4;
+        --pastel-mint: #D4F1E8;
+        --pastel-peach: #FFE5CC;
+        --pastel-lavender: #E6E6FA;
+        --pastel-yellow: #FFF9C4;
+        --dark-text: #4A4A4A;
+        --light-bg: #FEFEFE;
+    }
+    
+    /* Main app background */
+    .stApp {
+        background: linear-gradient(135deg, #FFE5F1 0%, #E6F3FF 100%);
+    }
+    
+    /* Sidebar styling */
+    [data-testid="stSidebar"] {
+        background: linear-gradient(180deg, #E0BBE4 0%, #FFD6E8 100%);
+    }
+    
+    [data-testid="stSidebar"] .stMarkdown {
+        color: var(--dark-text);
+    }
+    
+    /* Headers */
+    h1 {
+        color: #8B5FBF;
+        font-family: 'Georgia', serif;
+        text-align: center;
+        padding: 20px;
+        background: linear-gradient(90deg, #FFD6E8, #E0BBE4, #C1E7FF);
+        border-radius: 15px;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
+        margin-bottom: 30px;
+    }
+    
+    h2 {
+        color: #6B8FB5;
+        font-family: 'Georgia', serif;
+        border-bottom: 2px solid #C1E7FF;
+        padding-bottom: 10px;
+    }
+    
+    h3 {
+        color: #9D7BA5;
+        font-family: 'Georgia', serif;
+    }
+    
+    /* Message containers */
+    .character-message {
+        background: linear-gradient(135deg, #FFD6E8 0%, #FFF0F5 100%);
+        border-left: 5px solid #FF9FC7;
+        padding: 20px;
+        border-radius: 15px;
+        margin: 15px 0;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.08);
+        transition: transform 0.2s;
+    }
+    
+    .character-message:hover {
+        transform: translateX(5px);
+    }
+    
+    .storyteller-message {
+        background: linear-gradient(135deg, #E0BBE4 0%, #F5F0FF 100%);
+        border-left: 5px solid #9D7BA5;
+        padding: 20px;
+        border-radius: 15px;
+        margin: 15px 0;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.08);
+    }
+    
+    .quest-box {
+        background: linear-gradient(135deg, #FFF9C4 0%, #FFFEF0 100%);
+        border: 3px solid #F0E68C;
+        padding: 25px;
+        border-radius: 20px;
+        margin: 20px 0;
+        box-shadow: 0 6px 12px rgba(0,0,0,0.1);
+        text-align: center;
+    }
+    
+    .character-profile {
+        background: linear-gradient(135deg, #D4F1E8 0%, #F0FFFA 100%);
+        padding: 20px;
+        border-radius: 15px;
+        margin: 10px 0;
+        border: 2px solid #9FD8CB;
+        box-shadow: 0 4px 6px rgba(0,0,0,0.08);
+    }
+    
+    /* Buttons */
+    .stButton > button {
+        background: linear-gradient(135deg, #E0BBE4, #FFD6E8);
+        color: var(--dark-text);
+        border: none;
+        border-radius: 25px;
+        padding: 12px 30px;
+        font-weight: 600;
+        font-size: 16px;
+        box-shadow: 0 4px 8px rgba(0,0,0,0.15);
+        transition: all 0.3s;
+    }
+    
+    .stButton > button:hover {
+        transform: translateY(-2px);
+        box-shadow: 0 6px 12px rgba(0,0,0,0.2);
+        background: linear-gradient(135deg, #FFD6E8, #E0BBE4);
+    }
+    
+    /* Input fields */
+    .stTextInput > div > div > input {
+        border-radius: 15px;
+        border: 2px solid #E0BBE4;
+        padding: 12px;
+        background: var(--light-bg);
+    }
+    
+    .stTextArea > div > div > textarea {
+        border-radius: 15px;
+        border: 2px solid #E0BBE4;
+        background: var(--light-bg);
+    }
+    
+    /* Select boxes */
+    .stSelectbox > div > div {
+        border-radius: 15px;
+        border: 2px solid #C1E7FF;
+        background: var(--light-bg);
+    }
+    
+    /* Progress bar */
+    .stProgress > div > div > div {
+        background: linear-gradient(90deg, #FFD6E8, #E0BBE4, #C1E7FF);
+    }
+    
+    /* Metrics */
+    [data-testid="stMetricValue"] {
+        color: #8B5FBF;
+        font-size: 28px;
+    }
+    
+    /* Expander */
+    .streamlit-expanderHeader {
+        background: linear-gradient(135deg, #FFE5CC 0%, #FFF5E6 100%);
+        border-radius: 15px;
+        border: 2px solid #FFDAB9;
+    }
+    
+    /* Info boxes */
+    .stAlert {
+        border-radius: 15px;
+        border-left: 5px solid #C1E7FF;
+    }
+    
+    /* Spinner */
+    .stSpinner > div {
+        border-top-color: #E0BBE4 !important;
+    }
+    
+    /* Character badges */
+    .character-badge {
+        display: inline-block;
+        padding: 8px 16px;
+        border-radius: 20px;
+        margin: 5px;
+        font-weight: 600;
+        font-size: 14px;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+    }
+    
+    .badge-harry {
+        background: linear-gradient(135deg, #FFE5CC, #FFF0DB);
+        border: 2px solid #FFD700;
+    }
+    
+    .badge-ron {
+        background: linear-gradient(135deg, #FFD6E8, #FFE8F0);
+        border: 2px solid #FF69B4;
+    }
+    
+    .badge-hermione {
+        background: linear-gradient(135deg, #C1E7FF, #E0F3FF);
+        border: 2px solid #87CEEB;
+    }
+    
+    .badge-filch {
+        background: linear-gradient(135deg, #D4F1E8, #E8FAF5);
+        border: 2px solid #66CDAA;
+    }
+    
+    /* Animation for new messages */
+    @keyframes slideIn {
+        from {
+            opacity: 0;
+            transform: translateY(20px);
+        }
+        to {
+            opacity: 1;
+            transform: translateY(0);
+        }
+    }
+    
+    .new-message {
+        animation: slideIn 0.5s ease-out;
+    }
+    
+    /* Footer */
+    .footer {
+        text-align: center;
+        padding: 20px;
+        color: #8B5FBF;
+        font-style: italic;
+        margin-top: 40px;
+    }
+</style>
+""")
+
+
+# ===== STATIC HTML =====
+ADVENTURE_COMPLETE_HTML = minify_html("""
+    <div class='quest-box'>
+        <h3>🏆 Adventure Complete!</h3>
+        <p>The quest has concluded. Reset the game to start a new adventure!</p>
+    </div>
+""")
+
+HEADER_HTML = minify_html("""
+    <h1>🎲 Multi-Agent D&D Adventure 🎲</h1>
+""")
+
+FOOTER_HTML = minify_html("""
+    <div style='text-align: center; color: #8B5FBF; font-size: 12px; padding: 20px;'>
+        <p>✨ Powered by LangChain & OpenAI</p>
+        <p>🎨 Beautiful Pastel Design</p>
+    </div>
+""")
+
+WELCOME_HTML = minify_html("""
+    <div class='quest-box'>
+        <h2>🌟 Welcome to the Multi-Agent D&D Adventure! 🌟</h2>
+        <p style='font-size: 18px; color: #4A4A4A;'>
+            Watch as AI characters come to life and embark on epic quests together!
+        </p>
+        <br>
+        <p style='font-size: 14px; color: #6B6B6B;'>
+            This application uses advanced AI agents that collaborate autonomously to create 
+            dynamic storytelling experiences. Each character has unique personality traits 
+            and will interact naturally with others to complete the quest.
+        </p>
+    </div>
+""")
+
+FEATURE_CARDS_HTML = [
+    minify_html("""
+        <div class='character-profile'>
+            <h3 style='text-align: center;'>🎭 Dynamic Characters</h3>
+            <p style='text-align: center;'>AI agents with unique personalities and goals</p>
+        </div>
+    """),
+    minify_html("""
+        <div class='character-profile'>
+            <h3 style='text-align: center;'>📖 Emergent Storytelling</h3>
+            <p style='text-align: center;'>Unpredictable narratives that evolve naturally</p>
+        </div>
+    """),
+    minify_html("""
+        <div class='character-profile'>
+            <h3 style='text-align: center;'>🤝 Collaborative AI</h3>
+            <p style='text-align: center;'>Watch agents work together to solve challenges</p>
+        </div>
+    """),
+]
@@ -0,0 +1,277 @@
+"""
+Multi-Agent D&D Game - Batch Runner
+===================================
+Plays many games headlessly and streams every finished turn to JSONL, for
+pre-generating adventures and running evaluations.
+
+The games are the cross product of the config's quests and rosters, repeated
+`repeats` times. Each game is set up and played to `max_iterations` in a
+process or thread pool.
+
+Config (JSON):
+    {
+        "quests": ["Find all of Lord Voldemort's seven horcruxes."],
+        "rosters": [["Harry Potter", "Ron Weasley", "Hermione Granger", "Argus Filch"]],
+        "storyteller_name": "Dungeon Master",
+        "word_limit": 50,
+        "max_iterations": 20,
+        "repeats": 1,
+        "simultaneous": false,
+        "batched_setup": false,
+        "routing": {
+            "roles": {"character": {"model": "gpt-4o-mini", "temperature": 0.2}},
+            "agents": {"Dungeon Master": {"model": "gpt-4o", "fallback": "gpt-4o-mini", "latency_budget": 8}}
+        }
+    }
+
+With "simultaneous", characters act concurrently in rounds and the
+storyteller resolves each round in one response. "routing" (optional) maps
+roles and agents to models, as in `routing.RoutingConfig.from_dict()`.
+With "batched_setup", each game's descriptions and quest are requested in
+one structured call.
+
+With `--executor async`, every game runs as a coroutine on one event loop
+(`DialogueSimulator.arun()`) and `--workers` instead bounds the model calls
+in flight across all games, so hundreds of games need no extra threads.
+
+Run:
+    OPENAI_API_KEY=sk-... python batch.py config.json --out games.jsonl --workers 8
+    OPENAI_API_KEY=sk-... python batch.py config.json --executor async --workers 64
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+from engine import build_game_description, create_simulator, generate_game_setup
+from routing import RoutingConfig
+
+
+DEFAULT_CONFIG = {
+    "storyteller_name": "Dungeon Master",
+    "word_limit": 50,
+    "max_iterations": 20,
+    "repeats": 1,
+    "simultaneous": False,
+    "batched_setup": False,
+    "routing": None,
+}
+
+
+def load_config(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        config = {**DEFAULT_CONFIG, **json.load(f)}
+    if not config.get("quests") or not config.get("rosters"):
+        raise ValueError("Config must list at least one quest and one roster")
+    for roster in config["rosters"]:
+        if len(roster) < 2:
+            raise ValueError(f"Roster needs at least 2 characters: {roster}")
+    return config
+
+
+def expand_games(config: Dict) -> List[Dict]:
+    """Return one job per (quest, roster, repeat) combination."""
+    return [
+        {
+            "game_id": game_id,
+            "quest": quest,
+            "character_names": list(roster),
+            "repeat": repeat,
+            "storyteller_name": config["storyteller_name"],
+            "word_limit": config["word_limit"],
+            "max_iterations": config["max_iterations"],
+            "simultaneous": config["simultaneous"],
+            "routing": config["routing"],
+            "batched_setup": config["batched_setup"],
+        }
+        for game_id, (quest, roster, repeat) in enumerate(
+            itertools.product(config["quests"], config["rosters"], range(config["repeats"]))
+        )
+    ]
+
+
+def setup_game(game: Dict, api_key: str, records):
+    """Generate a game's descriptions and quest and build its simulator, recording the setup."""
+    character_names = game["character_names"]
+    storyteller_name = game["storyteller_name"]
+    word_limit = game["word_limit"]
+    game_description = build_game_description(game["quest"], character_names, storyteller_name)
+    routing = RoutingConfig.from_dict(game["routing"]) if game.get("routing") else None
+
+    character_descriptions, storyteller_description, specified_quest = generate_game_setup(
+        character_names, game_description, storyteller_name, word_limit, api_key,
+        routing=routing, batched=game.get("batched_setup", False)
+    )
+    simulator = create_simulator(
+        character_names,
+        character_descriptions,
+        storyteller_name,
+        storyteller_description,
+        game_description,
+        specified_quest,
+        word_limit,
+        api_key,
+        simultaneous=game.get("simultaneous", False),
+        routing=routing
+    )
+    records.put({
+        "type": "setup",
+        "game_id": game["game_id"],
+        "quest": game["quest"],
+        "repeat": game["repeat"],
+        "character_descriptions": {**character_descriptions, storyteller_name: storyteller_description},
+        "specified_quest": specified_quest,
+    })
+    return simulator
+
+
+def play_game(game: Dict, api_key: str, records) -> int:
+    """Set up and play one game, putting a record on `records` as each turn finishes.
+
+    Returns the number of turns played.
+    """
+    simulator = setup_game(game, api_key, records)
+    turn = 0
+    while turn < game["max_iterations"]:
+        started = time.perf_counter()
+        committed = simulator.advance()
+        latency = round(time.perf_counter() - started, 3)
+        for speaker, message in committed:
+            turn += 1
+            records.put({
+                "type": "turn",
+                "game_id": game["game_id"],
+                "turn": turn,
+                "speaker": speaker,
+                "message": message,
+                "latency": latency,
+            })
+    return turn
+
+
+async def aplay_game(game: Dict, api_key: str, records, limit: asyncio.Semaphore) -> int:
+    """Async `play_game()`: set up on a worker thread, then play on the event loop within `limit`."""
+    async with limit:
+        simulator = await asyncio.to_thread(setup_game, game, api_key, records)
+    turn = 0
+    started = time.perf_counter()
+    async for speaker, message in simulator.arun(game["max_iterations"], limit):
+        turn += 1
+        records.put({
+            "type": "turn",
+            "game_id": game["game_id"],
+            "turn": turn,
+            "speaker": speaker,
+            "message": message,
+            "latency": round(time.perf_counter() - started, 3),
+        })
+        started = time.perf_counter()
+    return turn
+
+
+async def _play_async(games: List[Dict], api_key: str, records, max_calls: int) -> List:
+    limit = asyncio.Semaphore(max_calls)
+    return await asyncio.gather(
+        *(aplay_game(game, api_key, records, limit) for game in games), return_exceptions=True
+    )
+
+
+def _write_records(records, out, stop: threading.Event) -> None:
+    while not stop.is_set() or not records.empty():
+        try:
+            record = records.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+
+def run_batch(config: Dict, out_path: str, workers: int = 4, executor_kind: str = "process", api_key: str = "") -> Dict:
+    """Play every game in `config` and stream their turns to `out_path`.
+
+    `executor_kind` is "process", "thread" or "async"; with "async", all
+    games share one event loop and `workers` bounds the model calls in flight.
+    Returns a summary with game, failure and turn counts and elapsed time.
+    """
+    games = expand_games(config)
+    started = time.perf_counter()
+    summary = {"games": len(games), "failed": 0, "turns": 0}
+
+    if executor_kind == "process":
+        manager = multiprocessing.Manager()
+        records = manager.Queue()
+        executor: Executor = ProcessPoolExecutor(max_workers=workers)
+    elif executor_kind == "thread":
+        manager = None
+        records = queue.Queue()
+        executor = ThreadPoolExecutor(max_workers=workers)
+    else:
+        manager = None
+        records = queue.Queue()
+        executor = None
+
+    stop = threading.Event()
+    with open(out_path, "a", encoding="utf-8") as out:
+        writer = threading.Thread(target=_write_records, args=(records, out, stop), daemon=True)
+        writer.start()
+        try:
+            if executor is None:
+                results = asyncio.run(_play_async(games, api_key, records, workers))
+                for game, result in zip(games, results):
+                    if isinstance(result, Exception):
+                        summary["failed"] += 1
+                        records.put({"type": "error", "game_id": game["game_id"], "error": repr(result)})
+                    else:
+                        summary["turns"] += result
+            else:
+                with executor:
+                    futures = {executor.submit(play_game, game, api_key, records): game for game in games}
+                    for future in as_completed(futures):
+                        game = futures[future]
+                        try:
+                            summary["turns"] += future.result()
+                        except Exception as exc:
+                            summary["failed"] += 1
+                            records.put({"type": "error", "game_id": game["game_id"], "error": repr(exc)})
+        finally:
+            stop.set()
+            writer.join()
+            if manager is not None:
+                manager.shutdown()
+
+    summary["elapsed"] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Play D&D games headlessly and write their turns to JSONL.")
+    parser.add_argument("config", help="JSON file with quests, rosters and game settings")
+    parser.add_argument("--out", default="games.jsonl", help="JSONL file to append records to")
+    parser.add_argument(
+        "--workers", type=int, default=4,
+        help="Number of games played at once (model calls in flight with --executor async)"
+    )
+    parser.add_argument("--executor", choices=["process", "thread", "async"], default="process")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("OPENAI_API_KEY", "")
+    if not api_key:
+        print("OPENAI_API_KEY is not set", file=sys.stderr)
+        return 2
+
+    summary = run_batch(load_config(args.config), args.out, args.workers, args.executor, api_key)
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Multi-Agent D&D Game - Offline Benchmarks
+=========================================
+Measures the engine's own overhead on the simulator hot path
+(`DialogueSimulator.step()` / `inject()`) with a local FakeChatModel, so
+regressions in prompt growth or history handling show up as numbers
+instead of hiding behind OpenAI latency.
+
+For each party size and game length it reports:
+    - engine CPU per turn (step CPU minus time spent inside the fake model)
+    - prompt-assembly time per turn
+    - prompt bytes and tokens sent (last turn and total)
+    - share of prompt tokens the fake model's simulated prompt cache served
+    - share of replies trimmed to the word limit (raise --words above
+      --word-limit to exercise max_tokens and trimming)
+    - peak traced memory
+
+With --simultaneous, characters act concurrently in rounds
+(`DialogueSimulator.advance()`), so wall time per round stays near two
+model latencies however large the party.
+
+With --resilience, calls go through a ResiliencePolicy (deadline, retries,
+optional --hedge), and the fake model can inject --failure-rate transient
+errors and a --tail-rate share of --tail-latency slow calls, to compare
+p50/p99 call latency with and without hedging.
+
+With --memory-top-k, agents prompt with that many recalled turns plus the
+recent ones (`memory.VectorMemory`), so bytes per turn stay flat as games
+grow.
+
+Run:
+    python bench.py
+    python bench.py --party-sizes 2 4 7 --turns 5 50 500 --latency 0.01 --json
+    python bench.py --party-sizes 7 --turns 50 --latency 0.2 --simultaneous
+    python bench.py --party-sizes 4 --turns 200 --latency 0.05 --tail-rate 0.05 --tail-latency 1 --resilience --hedge
+    python bench.py --party-sizes 4 --turns 50 500 --memory-top-k 6
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from engine import (
+    DialogueAgent,
+    DialogueSimulator,
+    build_game_description,
+    generate_character_system_message,
+    generate_storyteller_system_message,
+    select_next_speaker,
+)
+from fake_llm import FakeChatModel
+from memory import VectorMemory
+from resilience import ResiliencePolicy, ResilientModel
+
+
+ROSTER = [
+    "Harry Potter", "Ron Weasley", "Hermione Granger", "Argus Filch",
+    "Draco Malfoy", "Luna Lovegood", "Neville Longbottom",
+]
+STORYTELLER = "Dungeon Master"
+QUEST = "Find all of Lord Voldemort's seven horcruxes."
+DESCRIPTION = "A brave student of Hogwarts with a knack for trouble. " * 4
+
+
+def _token_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        # tiktoken missing, or its encoding file cannot be fetched offline
+        return lambda text: len(text) // 4
+
+
+def build_simulator(
+    party_size: int,
+    model: FakeChatModel,
+    word_limit: int = 50,
+    simultaneous: bool = False,
+    memory_top_k: int = 0
+) -> DialogueSimulator:
+    """A game over `model`, which may be a FakeChatModel or a ResilientModel wrapping one."""
+    names = ROSTER[:party_size]
+    game_description = build_game_description(QUEST, names, STORYTELLER)
+    agents = [
+        DialogueAgent(
+            STORYTELLER,
+            generate_storyteller_system_message(STORYTELLER, DESCRIPTION, game_description, word_limit, simultaneous),
+            model,
+            word_limit=word_limit,
+        )
+    ] + [
+        DialogueAgent(
+            name,
+            generate_character_system_message(name, DESCRIPTION, game_description, STORYTELLER, word_limit),
+            model,
+            word_limit=word_limit,
+        )
+        for name in names
+    ]
+    memory = VectorMemory(top_k=memory_top_k, recent=len(agents) + 1) if memory_top_k else None
+    simulator = DialogueSimulator(
+        agents=agents, selection_function=select_next_speaker, simultaneous=simultaneous, memory=memory
+    )
+    simulator.reset()
+    simulator.inject(STORYTELLER, QUEST)
+    return simulator
+
+
+def _time_prompt_assembly(simulator: DialogueSimulator, samples: List[float]) -> None:
+    # Wrap each agent's prompt builder to record how long assembly takes
+    for agent in simulator.agents:
+        build = agent._prompt
+
+        def timed(build=build):
+            started = time.perf_counter()
+            prompt = build()
+            samples.append(time.perf_counter() - started)
+            return prompt
+
+        agent._prompt = timed
+
+
+def run_case(
+    party_size: int,
+    turns: int,
+    latency: float,
+    words: int,
+    inject_every: int,
+    count_tokens,
+    simultaneous: bool = False,
+    policy: ResiliencePolicy = None,
+    word_limit: int = 50,
+    memory_top_k: int = 0,
+    **faults
+) -> Dict:
+    model = FakeChatModel(latency=latency, words=words, **faults)
+    simulator = build_simulator(
+        party_size,
+        model if policy is None else ResilientModel(model, policy),
+        word_limit=word_limit,
+        simultaneous=simultaneous,
+        memory_top_k=memory_top_k,
+    )
+    assembly: List[float] = []
+    _time_prompt_assembly(simulator, assembly)
+
+    cpu_per_turn: List[float] = []
+    wall_started = time.perf_counter()
+    tracemalloc.start()
+    turn = 0
+    next_inject = inject_every
+    while turn < turns:
+        model_cpu = model.stats["cpu"]
+        cpu_started = time.process_time()
+        if inject_every and turn >= next_inject:
+            simulator.inject("Player", "I light a torch and look around.")
+            next_inject += inject_every
+        committed = len(simulator.advance())
+        turn += committed
+        cpu = time.process_time() - cpu_started - (model.stats["cpu"] - model_cpu)
+        cpu_per_turn += [cpu / committed] * committed
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    wall = time.perf_counter() - wall_started
+
+    last_prompt = simulator.next_speaker._prompt()
+    stats = model.stats
+    return {
+        "party_size": party_size,
+        "mode": ("rounds" if simultaneous else "alternate") + ("+recall" if memory_top_k else ""),
+        "turns": turn,
+        "cpu_ms_mean": statistics.fmean(cpu_per_turn) * 1e3,
+        "cpu_ms_max": max(cpu_per_turn) * 1e3,
+        "assembly_us_mean": statistics.fmean(assembly) * 1e6,
+        "bytes_total": int(stats["prompt_bytes"]),
+        "bytes_last": int(stats["last_prompt_bytes"]),
+        "tokens_last": sum(count_tokens(str(message.content)) for message in last_prompt),
+        "cached_pct": simulator.ledger.totals()["cache_ratio"] * 100,
+        "trimmed_pct": simulator.ledger.totals()["truncated"] / max(1, len(simulator.ledger)) * 100,
+        "call_p50_ms": simulator.ledger.percentile("latency", 50) * 1e3,
+        "call_p99_ms": simulator.ledger.percentile("latency", 99) * 1e3,
+        "retries": policy.stats()["retries"] if policy else 0,
+        "hedges": policy.stats()["hedges"] if policy else 0,
+        "peak_mb": peak / 2**20,
+        "wall_s": wall,
+    }
+
+
+# (title, result key, format spec) of each table column
+COLUMNS = [
+    ("party", "party_size", "d"),
+    ("mode", "mode", "s"),
+    ("turns", "turns", "d"),
+    ("cpu ms/turn", "cpu_ms_mean", ".3f"),
+    ("cpu ms max", "cpu_ms_max", ".3f"),
+    ("assembly us", "assembly_us_mean", ".1f"),
+    ("bytes last", "bytes_last", "d"),
+    ("bytes total", "bytes_total", "d"),
+    ("tokens last", "tokens_last", "d"),
+    ("cached %", "cached_pct", ".1f"),
+    ("trim %", "trimmed_pct", ".1f"),
+    ("call p50 ms", "call_p50_ms", ".1f"),
+    ("call p99 ms", "call_p99_ms", ".1f"),
+    ("retries", "retries", "d"),
+    ("hedges", "hedges", "d"),
+    ("peak MB", "peak_mb", ".2f"),
+    ("wall s", "wall_s", ".2f"),
+]
+
+
+def format_table(results: List[Dict], columns: List[Tuple[str, str, str]] = COLUMNS) -> str:
+    """Right-aligned text table of `results`, one row each."""
+    rows = [[format(result[key], spec) for _, key, spec in columns] for result in results]
+    widths = [max([len(title)] + [len(row[i]) for row in rows]) for i, (title, _, _) in enumerate(columns)]
+    lines = ["  ".join(title.rjust(width) for (title, _, _), width in zip(columns, widths))]
+    lines += ["  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the simulator hot path with a fake chat model.")
+    parser.add_argument("--party-sizes", type=int, nargs="+", default=[2, 4, 7])
+    parser.add_argument("--turns", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake model latency per call, in seconds")
+    parser.add_argument("--words", type=int, default=50, help="Words per fake response")
+    parser.add_argument("--word-limit", type=int, default=50, help="Agents' word limit")
+    parser.add_argument("--inject-every", type=int, default=10, help="Inject a player message every N turns (0 disables)")
+    parser.add_argument("--simultaneous", action="store_true", help="Play in simultaneous-action rounds")
+    parser.add_argument("--resilience", action="store_true", help="Route calls through a ResiliencePolicy")
+    parser.add_argument("--hedge", action="store_true", help="Hedge calls slower than the recent p95 (with --resilience)")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-call deadline in seconds (with --resilience)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of fake calls that fail transiently")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Share of fake calls that are slow")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="Extra seconds for slow fake calls")
+    parser.add_argument("--memory-top-k", type=int, default=0, help="Recall this many relevant turns instead of the full history")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args(argv)
+    faults = {"failure_rate": args.failure_rate, "tail_rate": args.tail_rate, "tail_latency": args.tail_latency}
+
+    count_tokens = _token_counter()
+    results = []
+    for party_size in args.party_sizes:
+        for turns in args.turns:
+            policy = None
+            if args.resilience:
+                policy = ResiliencePolicy(timeout=args.timeout, hedge=args.hedge, hedge_min_delay=0.0, backoff=0.05)
+            result = run_case(
+                party_size, turns, args.latency, args.words, args.inject_every, count_tokens,
+                args.simultaneous, policy, args.word_limit, args.memory_top_k, **faults
+            )
+            results.append(result)
+            if args.json:
+                print(json.dumps(result))
+
+    if not args.json:
+        print(format_table(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Record / Replay Cassettes
+=========================
+Save every chat model response of a game to a file, then serve them again
+offline, so a game can be re-run deterministically without API calls, for
+profiling the engine and the UI or reproducing a rendering problem.
+
+A cassette is a JSON Lines file with one entry per response:
+`{"k": key, "c": content, "l": latency, "t": ttft, "u": usage, "f": finish reason}`.
+The key is a hash of the prompt's message types and whitespace-normalized
+contents, so re-indented prompt templates still match. A prompt sent
+several times replays its responses in recorded order, then keeps
+repeating the last one.
+
+While a cassette is active (`clients.use_cassette()`, or the
+`DND_CASSETTE` environment variable with `DND_CASSETTE_MODE=record|replay`
+and `DND_CASSETTE_TIMING=original|none`), every model handed out by
+`clients.get_chat_model()` goes through it: setup calls and every
+`DialogueAgent.send()` / `stream()` (and `asend()`). Replay either waits out the recorded
+latencies (and time to first token) or answers immediately.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+
+# ChatOpenAI's model when none is given; used to name replayed models
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+
+class CassetteMiss(KeyError):
+    """A replayed prompt has no recorded response."""
+
+
+def prompt_key(messages: List) -> str:
+    """Hash of the prompt's message types and contents, ignoring differences in whitespace."""
+    digest = hashlib.sha256()
+    for message in messages:
+        content = " ".join(str(message.content).split())
+        digest.update(f"{message.type}\0{content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Cassette:
+    """Responses recorded to, or replayed from, one cassette file.
+
+    `mode` is "record" (append every response to the file) or "replay"
+    (serve responses from it; unknown prompts raise CassetteMiss). With
+    `timing` "original", replay waits as long as the recorded call took;
+    with "none" it answers at once.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", timing: str = "original") -> None:
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if timing not in ("original", "none"):
+            raise ValueError(f"Unknown cassette timing: {timing}")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._played: Dict[str, int] = {}
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        if mode == "replay":
+            self._load()
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["k"], []).append(entry)
+
+    def record(self, key: str, content: str, latency: float, ttft: float, message) -> None:
+        """Append one response to the cassette file."""
+        entry = {
+            "k": key,
+            "c": content,
+            "l": round(latency, 4),
+            "t": round(ttft, 4),
+            "u": dict(getattr(message, "usage_metadata", None) or {}) or None,
+            "f": (getattr(message, "response_metadata", None) or {}).get("finish_reason"),
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.stats["recorded"] += 1
+
+    def play(self, key: str) -> Dict[str, Any]:
+        """The next recorded response for `key`."""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.stats["misses"] += 1
+                raise CassetteMiss(f"No recorded response for prompt {key[:12]} in {self.path}")
+            index = self._played.get(key, 0)
+            self._played[key] = index + 1
+            self.stats["replayed"] += 1
+            return entries[min(index, len(entries) - 1)]
+
+    def wrap(self, model, model_name: Optional[str], temperature: Optional[float]) -> "CassetteModel":
+        """A model that records `model`'s responses, or (when replaying, with `model` None) replays them.
+
+        A recording model keeps `model`'s own name; a replaying one is named
+        `model_name`, or ChatOpenAI's default.
+        """
+        if model is not None:
+            model_name = getattr(model, "model_name", None) or model_name
+        return CassetteModel(model, self, model_name or DEFAULT_MODEL, temperature)
+
+
+class CassetteModel:
+    """Chat model proxy that records responses to, or replays them from, a Cassette."""
+
+    def __init__(self, model, cassette: Cassette, model_name: str, temperature: Optional[float]) -> None:
+        self.model = model
+        self.cassette = cassette
+        self.model_name = model_name
+        self.temperature = temperature
+
+    def invoke(self, messages: List, **kwargs: Any):
+        key = prompt_key(messages)
+        if self.cassette.replaying:
+            entry = self.cassette.play(key)
+            if self.cassette.timing == "original":
+                time.sleep(entry["l"])
+            return _message(entry)
+        started = time.perf_counter()
+        message = self.model.invoke(messages, **kwargs)
+        latency = time.perf_counter() - started
+        self.cassette.record(key, message.content, latency, latency, message)
+        return message
+
+    async def ainvoke(self, messages: List, **kwargs: Any):
+        key = prompt_key(messages)
+        if self.cassette.replaying:
+            entry = self.cassette.play(key)
+            if self.cassette.timing == "original":
+                await asyncio.sleep(entry["l"])
+            return _message(entry)
+        started = time.perf_counter()
+        message = await self.model.ainvoke(messages, **kwargs)
+        latency = time.perf_counter() - started
+        self.cassette.record(key, message.content, latency, latency, message)
+        return message
+
+    async def astream(self, messages: List, **kwargs: Any) -> AsyncIterator:
+        key = prompt_key(messages)
+        if self.cassette.replaying:
+            entry = self.cassette.play(key)
+            for chunk, delay in self._replay_chunks(entry):
+                if delay:
+                    await asyncio.sleep(delay)
+                yield chunk
+            return
+        started = time.perf_counter()
+        ttft = None
+        aggregate = None
+        async for chunk in self.model.astream(messages, **kwargs):
+            if chunk.content and ttft is None:
+                ttft = time.perf_counter() - started
+            aggregate = chunk if aggregate is None else aggregate + chunk
+            yield chunk
+        latency = time.perf_counter() - started
+        content = aggregate.content if aggregate is not None else ""
+        self.cassette.record(key, content, latency, latency if ttft is None else ttft, aggregate)
+
+    def stream(self, messages: List, **kwargs: Any) -> Iterator:
+        key = prompt_key(messages)
+        if self.cassette.replaying:
+            return self._replay_stream(self.cassette.play(key))
+        return self._record_stream(key, messages, kwargs)
+
+    def _record_stream(self, key: str, messages: List, kwargs: Dict[str, Any]) -> Iterator:
+        started = time.perf_counter()
+        ttft = None
+        aggregate = None
+        for chunk in self.model.stream(messages, **kwargs):
+            if chunk.content and ttft is None:
+                ttft = time.perf_counter() - started
+            aggregate = chunk if aggregate is None else aggregate + chunk
+            yield chunk
+        latency = time.perf_counter() - started
+        content = aggregate.content if aggregate is not None else ""
+        self.cassette.record(key, content, latency, latency if ttft is None else ttft, aggregate)
+
+    def _replay_stream(self, entry: Dict[str, Any]) -> Iterator:
+        for chunk, delay in self._replay_chunks(entry):
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    def _replay_chunks(self, entry: Dict[str, Any]) -> Iterator:
+        """(chunk, seconds to wait before it) for a recorded response, one chunk per word."""
+        from langchain_core.messages import AIMessageChunk
+
+        words = entry["c"].split(" ")
+        wait = self.cassette.timing == "original"
+        # Spread the recorded time after the first token evenly over the words
+        per_word = max(0.0, entry["l"] - entry["t"]) / max(1, len(words) - 1)
+        for i, word in enumerate(words):
+            delay = (entry["t"] if i == 0 else per_word) if wait else 0
+            yield AIMessageChunk(content=word if i == 0 else f" {word}"), delay
+        yield AIMessageChunk(content="", **_metadata(entry)), 0
+
+    def __getattr__(self, name: str):
+        if self.model is None:
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+def _metadata(entry: Dict[str, Any]) -> Dict[str, Any]:
+    metadata: Dict[str, Any] = {"response_metadata": {"finish_reason": entry.get("f")}}
+    if entry.get("u"):
+        metadata["usage_metadata"] = entry["u"]
+    return metadata
+
+
+def _message(entry: Dict[str, Any]):
+    from langchain_core.messages import AIMessage
+
+    return AIMessage(content=entry["c"], **_metadata(entry))
@@ -0,0 +1,194 @@
+"""
+Chat Client Registry
+====================
+Process-wide registry of chat models, keyed by model and settings.
+
+Every model handed out shares one pooled HTTP client (and one async client),
+so connections and TLS sessions are reused across agents, setup calls and
+Streamlit sessions. The API key is passed to each client explicitly instead
+of through `os.environ`, which is racy when several sessions run at once.
+
+Pool limits default to the values below and can be overridden with the
+`DND_HTTP_MAX_CONNECTIONS`, `DND_HTTP_MAX_KEEPALIVE` and `DND_HTTP_TIMEOUT`
+environment variables or by calling `configure_pool()` before first use.
+
+Models are handed out wrapped in a `resilience.ResilientModel`, so every
+call gets a deadline, retries and optional hedging; the OpenAI client's own
+retries are turned off to leave that to the policy.
+
+The model name "fake", or the `DND_FAKE_LLM=1` environment variable for
+every model, hands out a local `fake_llm.FakeChatModel` instead, for load
+tests and offline runs; `DND_FAKE_LATENCY` (seconds) and `DND_FAKE_WORDS`
+set its latency and reply length.
+
+While a `cassette.Cassette` is active (`use_cassette()`, or the
+`DND_CASSETTE` environment variables), models are also wrapped to record
+their responses, or replaced by models replaying them offline.
+"""
+
+import hashlib
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from cassette import Cassette
+from resilience import ResiliencePolicy, ResilientModel, default_policy
+
+if TYPE_CHECKING:
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+# httpx and langchain_openai are imported on first use; they are slow to
+# import and not needed until a game starts.
+
+_lock = threading.Lock()
+_models: Dict[Tuple, "ChatOpenAI"] = {}
+_http_client: Optional["httpx.Client"] = None
+_http_async_client: Optional["httpx.AsyncClient"] = None
+_pool_settings = {
+    "max_connections": int(os.environ.get("DND_HTTP_MAX_CONNECTIONS", 100)),
+    "max_keepalive_connections": int(os.environ.get("DND_HTTP_MAX_KEEPALIVE", 20)),
+    "keepalive_expiry": 30.0,
+    "timeout": float(os.environ.get("DND_HTTP_TIMEOUT", 60.0)),
+}
+_cassette: Optional[Cassette] = None
+_cassette_loaded = False
+
+
+def use_cassette(cassette: Optional[Cassette]) -> None:
+    """Record or replay every model handed out from now on through `cassette` (None to stop)."""
+    global _cassette, _cassette_loaded
+    with _lock:
+        _cassette, _cassette_loaded = cassette, True
+
+
+def active_cassette() -> Optional[Cassette]:
+    """The active cassette, opened from `DND_CASSETTE` on first use if none was set."""
+    global _cassette, _cassette_loaded
+    with _lock:
+        if not _cassette_loaded:
+            path = os.environ.get("DND_CASSETTE")
+            if path:
+                _cassette = Cassette(
+                    path,
+                    mode=os.environ.get("DND_CASSETTE_MODE", "replay"),
+                    timing=os.environ.get("DND_CASSETTE_TIMING", "original"),
+                )
+            _cassette_loaded = True
+        return _cassette
+
+
+def configure_pool(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None,
+    timeout: Optional[float] = None
+) -> None:
+    """Change the shared connection pool limits.
+
+    Existing models keep their current pool; the registry is cleared so new
+    models pick up the new limits.
+    """
+    global _http_client, _http_async_client
+    with _lock:
+        for name, value in (
+            ("max_connections", max_connections),
+            ("max_keepalive_connections", max_keepalive_connections),
+            ("keepalive_expiry", keepalive_expiry),
+            ("timeout", timeout),
+        ):
+            if value is not None:
+                _pool_settings[name] = value
+        _http_client = None
+        _http_async_client = None
+        _models.clear()
+
+
+def _limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=_pool_settings["max_connections"],
+        max_keepalive_connections=_pool_settings["max_keepalive_connections"],
+        keepalive_expiry=_pool_settings["keepalive_expiry"],
+    )
+
+
+def _get_http_clients() -> Tuple["httpx.Client", "httpx.AsyncClient"]:
+    # Caller holds _lock
+    import httpx
+
+    global _http_client, _http_async_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=_limits(), timeout=_pool_settings["timeout"])
+    if _http_async_client is None:
+        _http_async_client = httpx.AsyncClient(limits=_limits(), timeout=_pool_settings["timeout"])
+    return _http_client, _http_async_client
+
+
+def get_chat_model(
+    temperature: float = 0.7,
+    model: Optional[str] = None,
+    api_key: Optional[str] = None,
+    resilience: Optional[ResiliencePolicy] = None,
+    **kwargs
+):
+    """Return the shared chat model for these settings, creating it on first use.
+
+    Models are cached per (model, temperature, API key, extra settings), so
+    identical requests from different agents or sessions share one client.
+    Calls go through `resilience`, or the process-wide default policy.
+    With an active cassette, the model records to it, or replays from it
+    without creating a client at all.
+    """
+    cassette = active_cassette()
+    if cassette is not None and cassette.replaying:
+        return cassette.wrap(None, model, temperature)
+    api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
+    kwargs.setdefault("max_retries", 0)
+    key = (
+        model,
+        temperature,
+        hashlib.sha256(api_key.encode("utf-8")).hexdigest(),
+        tuple(sorted(kwargs.items())),
+    )
+    with _lock:
+        chat_model = _models.get(key)
+        if chat_model is None and (model == "fake" or os.environ.get("DND_FAKE_LLM") == "1"):
+            chat_model = _fake_model(temperature, model)
+            _models[key] = chat_model
+        if chat_model is None:
+            from langchain_openai import ChatOpenAI
+
+            http_client, http_async_client = _get_http_clients()
+            if model is not None:
+                kwargs["model"] = model
+            chat_model = ChatOpenAI(
+                temperature=temperature,
+                api_key=api_key,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                **kwargs
+            )
+            _models[key] = chat_model
+    resilient = ResilientModel(chat_model, resilience or default_policy())
+    if cassette is not None:
+        return cassette.wrap(resilient, model, temperature)
+    return resilient
+
+
+def _fake_model(temperature: float, model: Optional[str]):
+    from fake_llm import FakeChatModel
+
+    return FakeChatModel(
+        latency=float(os.environ.get("DND_FAKE_LATENCY", 0.0)),
+        words=int(os.environ.get("DND_FAKE_WORDS", 50)),
+        model_name=model or "fake",
+        temperature=temperature,
+    )
+
+
+def registry_size() -> int:
+    """Number of distinct chat models currently shared."""
+    with _lock:
+        return len(_models)
@@ -13,314 +13,50 @@ Setup (Streamlit Secrets - Recommended):
 
 Run:
     streamlit run dnd_streamlit_app.py
+
+Record a game, then re-run it offline at full speed:
+    DND_CASSETTE=game.cassette.jsonl DND_CASSETTE_MODE=record streamlit run dnd.py
+    DND_CASSETTE=game.cassette.jsonl DND_CASSETTE_TIMING=none streamlit run dnd.py
 """
 
 import streamlit as st
-import os
-from typing import List, Callable
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
+import assets
+from streamlit.errors import StreamlitAPIException
 import time
-
-# ===== PAGE CONFIGURATION =====
-st.set_page_config(
-    page_title="AI D&D Adventure",
-    page_icon="🎲",
-    layout="wide",
-    initial_sidebar_state="expanded"
+import uuid
+from typing import List, Optional
+from clients import active_cassette
+from engine import AutoPlayer, build_game_description, create_simulator, generate_game_setup
+from llm_cache import LLMCache
+from metrics import MODEL_PRICES, UsageLedger
+from resilience import default_policy
+from routing import ModelRoute, RoutingConfig, fallback_stats
+from sessions import GameSession, SessionManager, default_manager
+from snapshot import (
+    build_header,
+    fork_snapshot,
+    list_snapshots,
+    load_snapshot,
+    new_snapshot_path,
+    restore_simulator,
+    save_snapshot,
 )
 
-# ===== CUSTOM CSS FOR PASTEL AESTHETIC =====
-st.markdown("""
-<style>
-    /* Main color palette - Soft Pastels */
-    :root {
-        --pastel-pink: #FFD6E8;
-        --pastel-blue: #C1E7FF;
-        --pastel-purple: #E0BBE4;
-        --pastel-mint: #D4F1E8;
-        --pastel-peach: #FFE5CC;
-        --pastel-lavender: #E6E6FA;
-        --pastel-yellow: #FFF9C4;
-        --dark-text: #4A4A4A;
-        --light-bg: #FEFEFE;
-    }
-    
-    /* Main app background */
-    .stApp {
-        background: linear-gradient(135deg, #FFE5F1 0%, #E6F3FF 100%);
-    }
-    
-    /* Sidebar styling */
-    [data-testid="stSidebar"] {
-        background: linear-gradient(180deg, #E0BBE4 0%, #FFD6E8 100%);
-    }
-    
-    [data-testid="stSidebar"] .stMarkdown {
-        color: var(--dark-text);
-    }
-    
-    /* Headers */
-    h1 {
-        color: #8B5FBF;
-        font-family: 'Georgia', serif;
-        text-align: center;
-        padding: 20px;
-        background: linear-gradient(90deg, #FFD6E8, #E0BBE4, #C1E7FF);
-        border-radius: 15px;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        margin-bottom: 30px;
-    }
-    
-    h2 {
-        color: #6B8FB5;
-        font-family: 'Georgia', serif;
-        border-bottom: 2px solid #C1E7FF;
-        padding-bottom: 10px;
-    }
-    
-    h3 {
-        color: #9D7BA5;
-        font-family: 'Georgia', serif;
-    }
-    
-    /* Message containers */
-    .character-message {
-        background: linear-gradient(135deg, #FFD6E8 0%, #FFF0F5 100%);
-        border-left: 5px solid #FF9FC7;
-        padding: 20px;
-        border-radius: 15px;
-        margin: 15px 0;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.08);
-        transition: transform 0.2s;
-    }
-    
-    .character-message:hover {
-        transform: translateX(5px);
-    }
-    
-    .storyteller-message {
-        background: linear-gradient(135deg, #E0BBE4 0%, #F5F0FF 100%);
-        border-left: 5px solid #9D7BA5;
-        padding: 20px;
-        border-radius: 15px;
-        margin: 15px 0;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.08);
-    }
-    
-    .quest-box {
-        background: linear-gradient(135deg, #FFF9C4 0%, #FFFEF0 100%);
-        border: 3px solid #F0E68C;
-        padding: 25px;
-        border-radius: 20px;
-        margin: 20px 0;
-        box-shadow: 0 6px 12px rgba(0,0,0,0.1);
-        text-align: center;
-    }
-    
-    .character-profile {
-        background: linear-gradient(135deg, #D4F1E8 0%, #F0FFFA 100%);
-        padding: 20px;
-        border-radius: 15px;
-        margin: 10px 0;
-        border: 2px solid #9FD8CB;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.08);
-    }
-    
-    /* Buttons */
-    .stButton > button {
-        background: linear-gradient(135deg, #E0BBE4, #FFD6E8);
-        color: var(--dark-text);
-        border: none;
-        border-radius: 25px;
-        padding: 12px 30px;
-        font-weight: 600;
-        font-size: 16px;
-        box-shadow: 0 4px 8px rgba(0,0,0,0.15);
-        transition: all 0.3s;
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 12px rgba(0,0,0,0.2);
-        background: linear-gradient(135deg, #FFD6E8, #E0BBE4);
-    }
-    
-    /* Input fields */
-    .stTextInput > div > div > input {
-        border-radius: 15px;
-        border: 2px solid #E0BBE4;
-        padding: 12px;
-        background: var(--light-bg);
-    }
-    
-    .stTextArea > div > div > textarea {
-        border-radius: 15px;
-        border: 2px solid #E0BBE4;
-        background: var(--light-bg);
-    }
-    
-    /* Select boxes */
-    .stSelectbox > div > div {
-        border-radius: 15px;
-        border: 2px solid #C1E7FF;
-        background: var(--light-bg);
-    }
-    
-    /* Progress bar */
-    .stProgress > div > div > div {
-        background: linear-gradient(90deg, #FFD6E8, #E0BBE4, #C1E7FF);
-    }
-    
-    /* Metrics */
-    [data-testid="stMetricValue"] {
-        color: #8B5FBF;
-        font-size: 28px;
-    }
-    
-    /* Expander */
-    .streamlit-expanderHeader {
-        background: linear-gradient(135deg, #FFE5CC 0%, #FFF5E6 100%);
-        border-radius: 15px;
-        border: 2px solid #FFDAB9;
-    }
-    
-    /* Info boxes */
-    .stAlert {
-        border-radius: 15px;
-        border-left: 5px solid #C1E7FF;
-    }
-    
-    /* Spinner */
-    .stSpinner > div {
-        border-top-color: #E0BBE4 !important;
-    }
-    
-    /* Character badges */
-    .character-badge {
-        display: inline-block;
-        padding: 8px 16px;
-        border-radius: 20px;
-        margin: 5px;
-        font-weight: 600;
-        font-size: 14px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    
-    .badge-harry {
-        background: linear-gradient(135deg, #FFE5CC, #FFF0DB);
-        border: 2px solid #FFD700;
-    }
-    
-    .badge-ron {
-        background: linear-gradient(135deg, #FFD6E8, #FFE8F0);
-        border: 2px solid #FF69B4;
-    }
-    
-    .badge-hermione {
-        background: linear-gradient(135deg, #C1E7FF, #E0F3FF);
-        border: 2px solid #87CEEB;
-    }
-    
-    .badge-filch {
-        background: linear-gradient(135deg, #D4F1E8, #E8FAF5);
-        border: 2px solid #66CDAA;
-    }
-    
-    /* Animation for new messages */
-    @keyframes slideIn {
-        from {
-            opacity: 0;
-            transform: translateY(20px);
-        }
-        to {
-            opacity: 1;
-            transform: translateY(0);
-        }
-    }
-    
-    .new-message {
-        animation: slideIn 0.5s ease-out;
-    }
-    
-    /* Footer */
-    .footer {
-        text-align: center;
-        padding: 20px;
-        color: #8B5FBF;
-        font-style: italic;
-        margin-top: 40px;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-
-# ===== AGENT CLASSES =====
-class DialogueAgent:
-    """Agent that can participate in conversations."""
-    
-    def __init__(self, name: str, system_message: SystemMessage, model: ChatOpenAI) -> None:
-        self.name = name
-        self.system_message = system_message
-        self.model = model
-        self.prefix = f"{self.name}: "
-        self.reset()
-
-    def reset(self):
-        self.message_history = ["Here is the conversation so far."]
-
-    def send(self) -> str:
-        message = self.model.invoke(
-            [
-                self.system_message,
-                HumanMessage(content="\n".join(self.message_history + [self.prefix])),
-            ]
-        )
-        return message.content
-
-    def receive(self, name: str, message: str) -> None:
-        self.message_history.append(f"{name}: {message}")
-
-
-class DialogueSimulator:
-    """Manages the conversation flow between agents."""
-    
-    def __init__(
-        self,
-        agents: List[DialogueAgent],
-        selection_function: Callable[[int, List[DialogueAgent]], int],
-    ) -> None:
-        self.agents = agents
-        self._step = 0
-        self.select_next_speaker = selection_function
-
-    def reset(self):
-        for agent in self.agents:
-            agent.reset()
-
-    def inject(self, name: str, message: str):
-        for agent in self.agents:
-            agent.receive(name, message)
-        self._step += 1
+# Adventure log entries shown before older ones are paged away
+LOG_PAGE_SIZE = 10
 
-    def step(self) -> tuple:
-        speaker_idx = self.select_next_speaker(self._step, self.agents)
-        speaker = self.agents[speaker_idx]
-        message = speaker.send()
-        
-        for receiver in self.agents:
-            receiver.receive(speaker.name, message)
-        
-        self._step += 1
-        return speaker.name, message
+# ===== PAGE CONFIGURATION =====
+def configure_page():
+    """Set page config and inject the pastel theme. Must run first in the script."""
+    st.set_page_config(
+        page_title="AI D&D Adventure",
+        page_icon="🎲",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    st.markdown(assets.CUSTOM_CSS, unsafe_allow_html=True)
 
 
-def select_next_speaker(step: int, agents: List[DialogueAgent]) -> int:
-    """Round-robin with storyteller interleaving."""
-    if step % 2 == 0:
-        return 0
-    else:
-        return (step // 2) % (len(agents) - 1) + 1
 
 
 # ===== HELPER FUNCTIONS =====
@@ -354,10 +90,8 @@ def initialize_session_state():
     """Initialize all session state variables."""
     if 'game_started' not in st.session_state:
         st.session_state.game_started = False
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
-    if 'simulator' not in st.session_state:
-        st.session_state.simulator = None
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
     if 'character_descriptions' not in st.session_state:
         st.session_state.character_descriptions = {}
     if 'quest_details' not in st.session_state:
@@ -368,66 +102,392 @@ def initialize_session_state():
         st.session_state.api_key = ""
 
 
-def generate_character_description(character_name: str, game_description: str, word_limit: int, api_key: str) -> str:
-    """Generate character description using LLM."""
-    os.environ["OPENAI_API_KEY"] = api_key
+@st.cache_resource
+def get_llm_cache(variety: int) -> LLMCache:
+    """Return the process-wide setup response cache."""
+    return LLMCache(variety=variety)
+
+
+def get_session_manager() -> SessionManager:
+    """Return the process-wide registry of live games."""
+    return default_manager()
+
+
+def current_game() -> Optional[GameSession]:
+    """Return this session's game, reloading it from disk if it was moved there while idle."""
+    return get_session_manager().get(st.session_state.session_id, st.session_state.api_key)
+
+
+def message_html(speaker: str, message: str, storyteller_name: str) -> str:
+    """Build the HTML for one adventure log entry."""
+    emoji = get_character_emoji(speaker)
     
-    player_descriptor_system_message = SystemMessage(
-        content="You can add detail to the description of a Dungeons & Dragons player."
-    )
+    if speaker == storyteller_name:
+        return f"""
+        <div class='storyteller-message new-message'>
+            <h4>{emoji} {speaker}</h4>
+            <p style='font-size: 16px; color: #4A4A4A; line-height: 1.6;'>{message}</p>
+        </div>
+        """
+    badge_class = get_character_color(speaker)
+    return f"""
+        <div class='character-message new-message'>
+            <span class='character-badge {badge_class}'>{emoji} {speaker}</span>
+            <p style='font-size: 16px; color: #4A4A4A; margin-top: 10px; line-height: 1.6;'>{message}</p>
+        </div>
+        """
+
+
+def log_html(game: GameSession, storyteller_name: str) -> List[str]:
+    """Return the HTML of every log entry, building only entries not seen before."""
+    cache = game.log_html
+    for turn in game.simulator.transcript.turns[len(cache):]:
+        cache.append(message_html(turn.speaker, turn.message, storyteller_name))
+    return cache
+
+
+def render_log(game: GameSession, storyteller_name: str):
+    """Render the most recent log entries, with older ones paged in a collapsed expander.
+    
+    Returns the container holding the recent entries, for appending new turns.
+    """
+    entries = log_html(game, storyteller_name)
+    older = len(entries) - LOG_PAGE_SIZE
+    
+    if older > 0:
+        with st.expander(f"📖 Earlier Turns ({older})", expanded=False):
+            pages = (older + LOG_PAGE_SIZE - 1) // LOG_PAGE_SIZE
+            page = st.number_input("Page", min_value=1, max_value=pages, value=pages, key="log_page")
+            start = (page - 1) * LOG_PAGE_SIZE
+            st.markdown("".join(entries[start:min(start + LOG_PAGE_SIZE, older)]), unsafe_allow_html=True)
+    
+    message_container = st.container()
+    with message_container:
+        for entry in entries[max(0, older):]:
+            st.markdown(entry, unsafe_allow_html=True)
+    return message_container
+
+
+def follow_autoplay(game: GameSession, message_container, storyteller_name: str):
+    """Render turns into the log as the auto-player commits them, without rerunning per turn.
+    
+    Returns once the auto-player finishes, fails, or is paused with no turn in progress.
+    """
+    autoplayer = game.autoplayer
+    rendered = len(game.simulator.transcript)
+    while True:
+        alive = autoplayer.alive
+        idle = autoplayer.paused and not autoplayer.busy
+        game.touch()
+        entries = log_html(game, storyteller_name)
+        with message_container:
+            while rendered < len(entries):
+                st.markdown(entries[rendered], unsafe_allow_html=True)
+                rendered += 1
+        st.session_state.game_step = autoplayer.steps_done
+        if not alive or idle:
+            break
+        time.sleep(0.1)
+
+
+def resume_game(path: str, **options):
+    """Rebuild a saved game from its snapshot without any API calls and make it the current game.
     
-    character_specifier_prompt = [
-        player_descriptor_system_message,
-        HumanMessage(
-            content=f"""{game_description}
-            Please reply with a creative description of the character, {character_name}, in {word_limit} words or less. 
-            Speak directly to {character_name}.
-            Do not add anything else."""
-        ),
-    ]
-    
-    llm = ChatOpenAI(temperature=1.0)
-    response = llm.invoke(character_specifier_prompt)
-    character_description = response.content
-
-    return character_description
-
-
-def generate_character_system_message(
-    character_name: str,
-    character_description: str,
-    game_description: str,
-    storyteller_name: str,
-    word_limit: int
-) -> SystemMessage:
-    """Create system message for character."""
-    return SystemMessage(
-        content=(
-            f"""{game_description}
-    Your name is {character_name}. 
-    Your character description is as follows: {character_description}.
-    You will propose actions you plan to take and {storyteller_name} will explain what happens when you take those actions.
-    Speak in the first person from the perspective of {character_name}.
-    For describing your own body movements, wrap your description in '*'.
-    Do not change roles!
-    Do not speak from the perspective of anyone else.
-    Remember you are {character_name}.
-    Stop speaking the moment you finish speaking from your perspective.
-    Never forget to keep your response to {word_limit} words!
-    Do not add anything else.
+    The game continues in a fork of the snapshot, since the session that
+    saved it may still be playing it. `options` (`compact_every`,
+    `prefetch`, `memory_top_k`) are passed to `restore_simulator`.
     """
+    header, turns = load_snapshot(path)
+    simulator = restore_simulator(header, turns, st.session_state.api_key, **options)
+    fork_path = fork_snapshot(simulator, header, path)
+    
+    get_session_manager().register(st.session_state.session_id, simulator, header, fork_path, **options)
+    st.session_state.character_descriptions = header["character_descriptions"]
+    st.session_state.quest_details = header["specified_quest"]
+    st.session_state.game_started = True
+    # The quest itself is the first turn, not a game step
+    st.session_state.game_step = max(0, len(turns) - 1)
+    st.session_state.character_names = header["character_names"]
+    st.session_state.storyteller_name = header["storyteller_name"]
+    st.session_state.max_iterations = header["max_iterations"]
+
+
+def render_saved_games_sidebar(**options):
+    """List saved games and resume the selected one."""
+    snapshots = list_snapshots()
+    if not snapshots:
+        return
+    
+    st.markdown("---")
+    st.markdown("### 📂 Saved Games")
+    labels = {
+        path: (
+            f"{time.strftime('%b %d %H:%M', time.localtime(header['created']))} · "
+            f"{header['quest'][:40]} ({len(header['character_names'])} heroes)"
+        )
+        for path, header in snapshots
+    }
+    selected = st.selectbox("Saved Game", options=list(labels), format_func=labels.get)
+    if st.button("📂 Resume", use_container_width=True, disabled=not st.session_state.api_key):
+        resume_game(selected, **options)
+        st.rerun()
+
+
+def render_routing_sidebar() -> RoutingConfig:
+    """Pick a model per role, with an optional faster fallback for slow turns."""
+    models = ["Default"] + [name for name in MODEL_PRICES if name != "fake"]
+    
+    def pick(label: str, help: str) -> Optional[str]:
+        choice = st.selectbox(label, options=models, help=help)
+        return None if choice == "Default" else choice
+    
+    with st.expander("🧭 Model Routing"):
+        storyteller = pick("Storyteller Model", "Model for the storyteller's turns")
+        character = pick("Character Model", "Model for every character's turns")
+        setup = pick("Setup Model", "Model for the descriptions and the quest")
+        summary = pick("Summary Model", "Model for history summaries")
+        fallback = pick(
+            "Fallback Model",
+            "Faster model that answers a turn when the chosen model is over the latency budget"
         )
+        latency_budget = st.slider(
+            "Latency Budget (s)",
+            min_value=1.0,
+            max_value=30.0,
+            value=8.0,
+            step=0.5,
+            disabled=fallback is None,
+            help="How long a turn may wait for its model before the fallback is asked too"
+        )
+    
+    budget = latency_budget if fallback is not None else None
+    return RoutingConfig({
+        "storyteller": ModelRoute(storyteller, 0.2, fallback, budget),
+        "character": ModelRoute(character, 0.2, fallback, budget),
+        "setup": ModelRoute(setup, 1.0),
+        "quest": ModelRoute(setup, 1.0),
+        "summary": ModelRoute(summary, 0.0),
+    })
+
+
+def render_usage_sidebar(ledger: UsageLedger):
+    """Show latency percentiles, token and cost totals, and a CSV export."""
+    st.markdown("---")
+    st.markdown("### 📈 Performance")
+    
+    if not len(ledger):
+        st.caption("Stats appear after the first turn.")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("⏱️ Latency p50", f"{ledger.percentile('latency', 50):.2f}s")
+        st.metric("⚡ TTFT p50", f"{ledger.percentile('ttft', 50):.2f}s")
+    with col2:
+        st.metric("⏱️ Latency p95", f"{ledger.percentile('latency', 95):.2f}s")
+        st.metric("⚡ TTFT p95", f"{ledger.percentile('ttft', 95):.2f}s")
+    
+    totals = ledger.totals()
+    st.caption(
+        f"{totals['prompt_tokens']:,} prompt ({totals['cache_ratio']:.0%} cached) + "
+        f"{totals['completion_tokens']:,} completion tokens · ${totals['cost']:.4f} · "
+        f"✂️ {totals['truncated']} of {totals['calls']} replies trimmed to the word limit"
+    )
+    
+    calls = default_policy().stats()
+    st.caption(
+        f"🛡️ Server-wide: {calls['retries']} retries · {calls['timeouts']} timeouts · "
+        f"{calls['hedges']} hedges ({calls['hedge_wins']} won) · "
+        f"{fallback_stats()['fallbacks']} fallbacks ({fallback_stats()['fallback_wins']} won)"
+    )
+    
+    st.caption("Prompt cache hits per turn (%)")
+    st.line_chart([round(ratio * 100) for ratio in ledger.cache_ratios()], height=120)
+    
+    st.dataframe(
+        [
+            {
+                "Agent": agent,
+                "Calls": stats["calls"],
+                "p50 s": round(stats["latency_p50"], 2),
+                "p95 s": round(stats["latency_p95"], 2),
+                "Tokens": stats["prompt_tokens"] + stats["completion_tokens"],
+                "Cached %": round(stats["cache_ratio"] * 100),
+                "Trimmed": stats["truncated"],
+                "Cost $": round(stats["cost"], 4),
+            }
+            for agent, stats in ledger.per_agent().items()
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    st.caption("Per model")
+    st.dataframe(
+        [
+            {
+                "Model": model,
+                "Calls": stats["calls"],
+                "p50 s": round(stats["latency_p50"], 2),
+                "p95 s": round(stats["latency_p95"], 2),
+                "$/call": round(stats["cost_per_call"], 5),
+                "Cost $": round(stats["cost"], 4),
+            }
+            for model, stats in ledger.per_model().items()
+        ],
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    st.download_button(
+        "⬇️ Download Usage CSV",
+        data=ledger.to_csv(),
+        file_name="dnd_usage.csv",
+        mime="text/csv",
+        use_container_width=True
     )
 
 
+def render_server_sidebar(manager: SessionManager):
+    """Show how many games this server holds in memory and on disk."""
+    stats = manager.stats()
+    st.caption(
+        f"🖥️ {stats['active']} games in memory ({stats['memory_mb']:.1f} MB) · "
+        f"{stats['on_disk']} idle on disk"
+    )
+    cassette = active_cassette()
+    if cassette is not None:
+        st.caption(
+            f"📼 {'Replaying' if cassette.replaying else 'Recording'} cassette `{cassette.path}` · "
+            f"{cassette.stats['recorded']} recorded · {cassette.stats['replayed']} replayed"
+        )
+
+
+# ===== GAME PANEL =====
+@st.fragment
+def render_game_panel(autoplay_speed: str, stats_area):
+    """Metrics, adventure log and turn controls, plus the usage and server stats in the sidebar's `stats_area`.
+    
+    Runs as a fragment, so Next Turn and the auto-play controls only rerun
+    this panel instead of the whole page; its writes to `stats_area` are
+    redrawn with it.
+    """
+    game = current_game()
+    with stats_area:
+        render_usage_sidebar(game.simulator.ledger)
+        render_server_sidebar(get_session_manager())
+    
+    # Game metrics
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🎮 Turn", st.session_state.game_step)
+    with col2:
+        st.metric("🎭 Characters", len(st.session_state.character_names))
+    with col3:
+        progress = min(100, int((st.session_state.game_step / st.session_state.max_iterations) * 100))
+        st.metric("📊 Progress", f"{progress}%")
+    with col4:
+        st.metric("💰 Cost", f"${game.simulator.ledger.totals()['cost']:.4f}")
+    
+    st.markdown("---")
+    
+    # Display messages
+    st.markdown("### 📜 Adventure Log")
+    
+    message_container = render_log(game, st.session_state.storyteller_name)
+    
+    # Next turn button
+    st.markdown("---")
+    
+    autoplayer = game.autoplayer
+    autoplay_active = autoplayer is not None and autoplayer.alive
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        if st.session_state.game_step < st.session_state.max_iterations:
+            if autoplayer is not None and autoplayer.error is not None:
+                st.error(f"Auto-play stopped: {autoplayer.error}")
+                game.autoplayer = None
+    
+            if not autoplay_active:
+                button_col1, button_col2 = st.columns(2)
+                with button_col1:
+                    next_turn = st.button("⏭️ Next Turn", use_container_width=True, type="primary")
+                with button_col2:
+                    start_autoplay = st.button("▶️ Auto-Play", use_container_width=True)
+    
+                if next_turn and len(game.simulator.next_speakers) > 1:
+                    with message_container, st.spinner("⚔️ The party acts..."):
+                        st.session_state.game_step += len(game.simulator.advance())
+                    rerun_game_panel()
+                elif next_turn:
+                    simulator = game.simulator
+                    speaker = simulator.next_speaker.name
+                    with message_container:
+                        if speaker == st.session_state.storyteller_name:
+                            st.markdown(f"<h4>{get_character_emoji(speaker)} {speaker}</h4>", unsafe_allow_html=True)
+                        else:
+                            st.markdown(f"""
+                            <span class='character-badge {get_character_color(speaker)}'>{get_character_emoji(speaker)} {speaker}</span>
+                            """, unsafe_allow_html=True)
+                        st.write_stream(simulator.stream_step())
+                    st.session_state.game_step += 1
+                    rerun_game_panel()
+    
+                if start_autoplay:
+                    turns_per_second = None if autoplay_speed == "No cap" else float(autoplay_speed[:-2])
+                    autoplayer = AutoPlayer(
+                        game.simulator,
+                        st.session_state.max_iterations,
+                        turns_per_second=turns_per_second,
+                        steps_done=st.session_state.game_step
+                    ).start()
+                    game.autoplayer = autoplayer
+                    autoplay_active = True
+            elif autoplayer.paused:
+                button_col1, button_col2 = st.columns(2)
+                with button_col1:
+                    if st.button("▶️ Resume", use_container_width=True, type="primary"):
+                        autoplayer.resume()
+                        rerun_game_panel()
+                with button_col2:
+                    if st.button("⏹️ Stop Auto-Play", use_container_width=True):
+                        autoplayer.stop()
+                        rerun_game_panel()
+            else:
+                if st.button("⏸️ Pause", use_container_width=True):
+                    autoplayer.pause()
+                    rerun_game_panel()
+    
+            if autoplay_active and (not autoplayer.paused or autoplayer.busy):
+                with st.spinner("🎲 Auto-playing..."):
+                    follow_autoplay(game, message_container, st.session_state.storyteller_name)
+                if not autoplayer.alive and autoplayer.error is None:
+                    game.autoplayer = None
+                rerun_game_panel()
+        else:
+            st.markdown(assets.ADVENTURE_COMPLETE_HTML, unsafe_allow_html=True)
+
+
+def rerun_game_panel():
+    """Rerun just the game panel, or the whole app once the adventure is over."""
+    if st.session_state.game_step >= st.session_state.max_iterations:
+        st.rerun()
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # The panel is running as part of a full-app run (e.g. auto-play
+        # continuing after a sidebar change), where fragment scope is not allowed
+        st.rerun()
+
+
 # ===== MAIN APP =====
 def main():
+    configure_page()
     initialize_session_state()
     
     # Header
-    st.markdown("""
-        <h1>🎲 Multi-Agent D&D Adventure 🎲</h1>
-    """, unsafe_allow_html=True)
+    st.markdown(assets.HEADER_HTML, unsafe_allow_html=True)
     
     # Sidebar
     with st.sidebar:
@@ -438,7 +498,6 @@ def main():
         try:
             api_key = st.secrets["OPENAI_API_KEY"]
             st.session_state.api_key = api_key
-            os.environ["OPENAI_API_KEY"] = api_key
             st.success("✅ API Key loaded from secrets")
         except:
             # API Key input if not in secrets
@@ -451,7 +510,6 @@ def main():
             
             if api_key:
                 st.session_state.api_key = api_key
-                os.environ["OPENAI_API_KEY"] = api_key
         
         st.markdown("---")
         
@@ -499,6 +557,81 @@ def main():
             help="Number of conversation turns"
         )
         
+        compact_history = st.checkbox(
+            "🧠 Summarize Long Histories",
+            value=False,
+            help="Fold older turns into a running story summary in the background to keep prompts small"
+        )
+        
+        compact_every = st.slider(
+            "Summarize Every N Turns",
+            min_value=4,
+            max_value=20,
+            value=10,
+            disabled=not compact_history,
+            help="How many new turns to collect before updating the story summary"
+        )
+        
+        autoplay_speed = st.select_slider(
+            "Auto-Play Speed Cap",
+            options=["No cap", "0.2/s", "0.5/s", "1/s", "2/s"],
+            value="No cap",
+            help="Maximum turns per second when auto-playing the adventure"
+        )
+        
+        prefetch_turns = st.checkbox(
+            "⚡ Prefetch Next Turn",
+            value=False,
+            help="Generate the upcoming turn in the background while you read, so Next Turn shows it instantly"
+        )
+        
+        simultaneous = st.checkbox(
+            "⚔️ Simultaneous Actions",
+            value=False,
+            help="All characters act at once after each narration, and the storyteller resolves their actions together"
+        )
+        
+        recall_turns = st.checkbox(
+            "🔎 Recall Relevant Turns",
+            value=False,
+            help="Send each agent the recent turns plus the earlier turns most relevant to them, so long games keep a fixed prompt size"
+        )
+        
+        game_options = {
+            "compact_every": compact_every if compact_history else None,
+            "prefetch": prefetch_turns,
+            "memory_top_k": 6 if recall_turns else None,
+        }
+        
+        autosave = st.checkbox(
+            "💾 Auto-Save Games",
+            value=True,
+            help="Save the game to disk after every turn so it can be resumed later"
+        )
+        
+        batched_setup = st.checkbox(
+            "🧩 Batched Setup",
+            value=False,
+            help="Generate every description and the quest in one structured request, retrying any that fail one by one"
+        )
+        
+        cache_setup = st.checkbox(
+            "📦 Cache Setup Responses",
+            value=False,
+            help="Reuse stored character descriptions and quests for repeated setups"
+        )
+        
+        cache_variety = st.slider(
+            "Cached Variations",
+            min_value=1,
+            max_value=5,
+            value=1,
+            disabled=not cache_setup,
+            help="Number of different responses to store and rotate through per setup prompt"
+        )
+        
+        routing = render_routing_sidebar()
+        
         st.markdown("---")
         
         # Control buttons
@@ -511,67 +644,35 @@ def main():
             reset_button = st.button("🔄 Reset Game", use_container_width=True)
         
         if reset_button:
+            get_session_manager().drop(st.session_state.session_id)
             st.session_state.game_started = False
-            st.session_state.messages = []
-            st.session_state.simulator = None
             st.session_state.character_descriptions = {}
             st.session_state.quest_details = ""
             st.session_state.game_step = 0
             st.rerun()
         
+        render_saved_games_sidebar(**game_options)
+        
+        # Filled by the game panel while a game is on, so its stats follow every turn
+        stats_area = st.container()
+        game = current_game() if st.session_state.game_started else None
+        if game is None:
+            with stats_area:
+                render_server_sidebar(get_session_manager())
+        
         st.markdown("---")
-        st.markdown("""
-            <div style='text-align: center; color: #8B5FBF; font-size: 12px; padding: 20px;'>
-                <p>✨ Powered by LangChain & OpenAI</p>
-                <p>🎨 Beautiful Pastel Design</p>
-            </div>
-        """, unsafe_allow_html=True)
+        st.markdown(assets.FOOTER_HTML, unsafe_allow_html=True)
     
     # Main content area
     if not st.session_state.api_key:
         st.info("👈 Please enter your OpenAI API key in the sidebar or set up Streamlit secrets to begin your adventure!")
         
-        st.markdown("""
-        <div class='quest-box'>
-            <h2>🌟 Welcome to the Multi-Agent D&D Adventure! 🌟</h2>
-            <p style='font-size: 18px; color: #4A4A4A;'>
-                Watch as AI characters come to life and embark on epic quests together!
-            </p>
-            <br>
-            <p style='font-size: 14px; color: #6B6B6B;'>
-                This application uses advanced AI agents that collaborate autonomously to create 
-                dynamic storytelling experiences. Each character has unique personality traits 
-                and will interact naturally with others to complete the quest.
-            </p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(assets.WELCOME_HTML, unsafe_allow_html=True)
         
         # Feature showcase
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.markdown("""
-            <div class='character-profile'>
-                <h3 style='text-align: center;'>🎭 Dynamic Characters</h3>
-                <p style='text-align: center;'>AI agents with unique personalities and goals</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown("""
-            <div class='character-profile'>
-                <h3 style='text-align: center;'>📖 Emergent Storytelling</h3>
-                <p style='text-align: center;'>Unpredictable narratives that evolve naturally</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            st.markdown("""
-            <div class='character-profile'>
-                <h3 style='text-align: center;'>🤝 Collaborative AI</h3>
-                <p style='text-align: center;'>Watch agents work together to solve challenges</p>
-            </div>
-            """, unsafe_allow_html=True)
+        for col, card in zip(st.columns(3), assets.FEATURE_CARDS_HTML):
+            with col:
+                st.markdown(card, unsafe_allow_html=True)
         
         return
     
@@ -582,115 +683,77 @@ def main():
     # Start game logic
     if start_button and not st.session_state.game_started:
         with st.spinner("🎨 Generating character descriptions..."):
-            game_description = f"""Here is the topic for a Dungeons & Dragons game: {quest}.
-                The characters are: {', '.join(character_names)}.
-                The story is narrated by the storyteller, {storyteller_name}."""
+            game_description = build_game_description(quest, character_names, storyteller_name)
             
-            # Generate descriptions
-            character_descriptions = {}
+            # Generate descriptions and quest concurrently
             progress_bar = st.progress(0)
-            
-            for idx, character_name in enumerate(character_names):
-                character_descriptions[character_name] = generate_character_description(
-                    character_name, game_description, word_limit, st.session_state.api_key
-                )
-                progress_bar.progress((idx + 1) / (len(character_names) + 2))
-                time.sleep(0.1)
-            
-            storyteller_description = generate_character_description(
-                storyteller_name, game_description, word_limit, st.session_state.api_key
-            )
-            progress_bar.progress((len(character_names) + 1) / (len(character_names) + 2))
-            
-            # Generate detailed quest
-            quest_specifier_prompt = [
-                SystemMessage(content="You can make a task more specific."),
-                HumanMessage(
-                    content=f"""{game_description}
-                    
-                    You are the storyteller, {storyteller_name}.
-                    Please make the quest more specific. Be creative and imaginative.
-                    Please reply with the specified quest in {word_limit} words or less. 
-                    Speak directly to the characters: {', '.join(character_names)}.
-                    Do not add anything else."""
-                ),
-            ]
-            
-            specified_quest = ChatOpenAI(temperature=1.0).invoke(quest_specifier_prompt).content
-
-            progress_bar.progress(1.0)
-            time.sleep(0.5)
-            
-            # Create system messages
-            character_system_messages = [
-                generate_character_system_message(
-                    character_name,
-                    character_descriptions[character_name],
-                    game_description,
-                    storyteller_name,
-                    word_limit
-                )
-                for character_name in character_names
-            ]
-            
-            storyteller_system_message = SystemMessage(
-                content=(
-                    f"""{game_description}
-            You are the storyteller, {storyteller_name}. 
-            Your description is as follows: {storyteller_description}.
-            The other players will propose actions to take and you will explain what happens when they take those actions.
-            Speak in the first person from the perspective of {storyteller_name}.
-            Do not change roles!
-            Do not speak from the perspective of anyone else.
-            Remember you are the storyteller, {storyteller_name}.
-            Stop speaking the moment you finish speaking from your perspective.
-            Never forget to keep your response to {word_limit} words!
-            Do not add anything else.
-            """
-                )
-            )
-            
-            # Create agents
-            characters = []
-            for character_name, character_system_message in zip(character_names, character_system_messages):
-                characters.append(
-                    DialogueAgent(
-                        name=character_name,
-                        system_message=character_system_message,
-                        model=ChatOpenAI(temperature=0.2),
-                    )
-                )
-            
-            storyteller = DialogueAgent(
-                name=storyteller_name,
-                system_message=storyteller_system_message,
-                model=ChatOpenAI(temperature=0.2),
+            character_descriptions, storyteller_description, specified_quest = generate_game_setup(
+                character_names,
+                game_description,
+                storyteller_name,
+                word_limit,
+                st.session_state.api_key,
+                on_progress=lambda done, total: progress_bar.progress(done / total),
+                cache=get_llm_cache(cache_variety) if cache_setup else None,
+                routing=routing,
+                batched=batched_setup
             )
             
-            # Create simulator
-            simulator = DialogueSimulator(
-                agents=[storyteller] + characters,
-                selection_function=select_next_speaker
+            simulator = create_simulator(
+                character_names,
+                character_descriptions,
+                storyteller_name,
+                storyteller_description,
+                game_description,
+                specified_quest,
+                word_limit,
+                st.session_state.api_key,
+                simultaneous=simultaneous,
+                routing=routing,
+                **game_options
             )
             
-            simulator.reset()
-            simulator.inject(storyteller_name, specified_quest)
+            # The quest opens the transcript; `max_iterations` turns follow it
+            simulator.max_turns = len(simulator.transcript) + max_iterations
             
             # Save to session state
-            st.session_state.simulator = simulator
             st.session_state.character_descriptions = character_descriptions
             st.session_state.character_descriptions[storyteller_name] = storyteller_description
             st.session_state.quest_details = specified_quest
             st.session_state.game_started = True
-            st.session_state.messages = [(storyteller_name, specified_quest)]
             st.session_state.game_step = 0
             st.session_state.character_names = character_names
             st.session_state.storyteller_name = storyteller_name
             st.session_state.max_iterations = max_iterations
             
+            header = build_header(
+                simulator,
+                st.session_state.character_descriptions,
+                quest,
+                specified_quest,
+                word_limit,
+                max_iterations
+            )
+            snapshot_path = None
+            if autosave:
+                snapshot_path = new_snapshot_path()
+                save_snapshot(snapshot_path, simulator, header)
+            get_session_manager().register(
+                st.session_state.session_id,
+                simulator,
+                header,
+                snapshot_path,
+                **game_options
+            )
+            
             st.success("✨ Characters generated! The adventure begins...")
             st.rerun()
     
+    # The game is gone if the server restarted or it was reset in another tab
+    if st.session_state.game_started and game is None:
+        st.session_state.game_started = False
+        st.warning("⚠️ This game is no longer available. Resume it from Saved Games or start a new one.")
+    
     # Display game if started
     if st.session_state.game_started:
         # Display quest
@@ -718,63 +781,7 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
         
-        # Game metrics
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("🎮 Turn", st.session_state.game_step)
-        with col2:
-            st.metric("🎭 Characters", len(st.session_state.character_names))
-        with col3:
-            progress = min(100, int((st.session_state.game_step / st.session_state.max_iterations) * 100))
-            st.metric("📊 Progress", f"{progress}%")
-        
-        st.markdown("---")
-        
-        # Display messages
-        st.markdown("### 📜 Adventure Log")
-        
-        message_container = st.container()
-        with message_container:
-            for speaker, message in st.session_state.messages:
-                emoji = get_character_emoji(speaker)
-                
-                if speaker == st.session_state.storyteller_name:
-                    st.markdown(f"""
-                    <div class='storyteller-message new-message'>
-                        <h4>{emoji} {speaker}</h4>
-                        <p style='font-size: 16px; color: #4A4A4A; line-height: 1.6;'>{message}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    badge_class = get_character_color(speaker)
-                    st.markdown(f"""
-                    <div class='character-message new-message'>
-                        <span class='character-badge {badge_class}'>{emoji} {speaker}</span>
-                        <p style='font-size: 16px; color: #4A4A4A; margin-top: 10px; line-height: 1.6;'>{message}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-        
-        # Next turn button
-        st.markdown("---")
-        
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            if st.session_state.game_step < st.session_state.max_iterations:
-                if st.button("⏭️ Next Turn", use_container_width=True, type="primary"):
-                    with st.spinner("🎲 Rolling dice..."):
-                        speaker, message = st.session_state.simulator.step()
-                        st.session_state.messages.append((speaker, message))
-                        st.session_state.game_step += 1
-                        time.sleep(0.5)
-                        st.rerun()
-            else:
-                st.markdown("""
-                <div class='quest-box'>
-                    <h3>🏆 Adventure Complete!</h3>
-                    <p>The quest has concluded. Reset the game to start a new adventure!</p>
-                </div>
-                """, unsafe_allow_html=True)
-    
+        render_game_panel(autoplay_speed, stats_area)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,1184 @@
+"""
+Multi-Agent D&D Game - Engine
+=============================
+The headless game engine: the shared transcript, dialogue agents, the
+simulator and turn selection, plus the LLM-backed setup helpers and
+system-message builders. Nothing here depends on Streamlit, so games can be
+played from scripts, batch runners and benchmarks as well as the web app.
+"""
+
+import asyncio
+import bisect
+import contextlib
+import logging
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Generator, List, Optional, Tuple
+from llm_cache import LLMCache
+from metrics import UsageLedger
+from routing import RoutingConfig
+
+if TYPE_CHECKING:
+    from langchain_core.messages import SystemMessage
+    from langchain_openai import ChatOpenAI
+    from memory import VectorMemory
+
+logger = logging.getLogger(__name__)
+
+# LangChain message classes are imported inside the functions that build
+# prompts, so importing the engine (and the app's landing page) stays cheap.
+
+# OpenAI accepts at most this many stop sequences per request
+MAX_STOP_SEQUENCES = 4
+# A sentence end: terminal punctuation plus any closing quotes, brackets or '*'
+_SENTENCE_END = re.compile(r"""[.!?…]["'”’)\]*]*(?=\s|$)""")
+
+
+def max_tokens_for(word_limit: int) -> int:
+    """Completion token budget for a `word_limit`-word reply.
+    
+    English averages about 1.3 tokens per word; the extra headroom lets a
+    reply that slightly overruns be trimmed at a sentence end instead of
+    being cut mid-word.
+    """
+    return int(word_limit * 1.6) + 16
+
+
+def trim_response(text: str, word_limit: int, cut: bool = False) -> Tuple[str, bool]:
+    """Trim `text` to at most `word_limit` words, ending at the last complete sentence.
+    
+    `cut` marks text that was stopped mid-sentence (e.g. by max_tokens) and is
+    trimmed back to a sentence end even when short enough. Returns (text,
+    whether it was trimmed). Text without any sentence end inside the limit
+    is cut at the last whole word.
+    """
+    text = text.strip()
+    words = list(re.finditer(r"\S+", text))
+    if len(words) <= word_limit and not cut:
+        return text, False
+    head = text[:words[min(len(words), word_limit) - 1].end()] if words else ""
+    ends = list(_SENTENCE_END.finditer(head))
+    # Don't throw away most of the reply just to end on a full stop
+    if ends and ends[-1].end() >= len(head) // 3:
+        head = head[:ends[-1].end()]
+    return head.rstrip(), head != text
+
+
+# ===== AGENT CLASSES =====
+class Turn:
+    """A single committed line of the conversation."""
+    
+    __slots__ = ("speaker", "message")
+    
+    def __init__(self, speaker: str, message: str) -> None:
+        self.speaker = sys.intern(speaker)
+        self.message = message
+
+    def __iter__(self):
+        # Allows `speaker, message = turn`
+        yield self.speaker
+        yield self.message
+
+    def __repr__(self) -> str:
+        return f"Turn({self.speaker!r}, {self.message!r})"
+
+
+class Transcript:
+    """Append-only conversation log shared by every agent in a game.
+    
+    It also holds each turn as chat messages, built once and shared by
+    every agent's prompt: a user form prefixed with the speaker, which the
+    other agents see, and an assistant form, which the speaker sees.
+    """
+    
+    HEADER = "Here is the conversation so far."
+    SUMMARY_HEADER = "Here is the story so far:"
+    RECALL_HEADER = "Earlier events that may matter now:"
+    
+    def __init__(self) -> None:
+        self.generation = 0
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.turns: List[Turn] = []
+            # Chat message forms of the turns converted so far, and where each speaker's turns are
+            self._user: list = []
+            self._assistant: list = []
+            self._spoken: Dict[str, List[int]] = {}
+        # (summary text, number of leading turns folded into it)
+        self._summary: Tuple[str, int] = ("", 0)
+        self._summary_message = None
+        # Lets in-flight background work detect that the log was cleared
+        self.generation += 1
+
+    @property
+    def summary(self) -> str:
+        return self._summary[0]
+
+    @property
+    def summarized_turns(self) -> int:
+        return self._summary[1]
+
+    def fold(self, summary: str, upto: int, generation: int) -> bool:
+        """Replace the first `upto` turns in prompts with `summary`.
+        
+        Ignored if the transcript was cleared since the summary was requested
+        or a newer summary already covers more turns.
+        """
+        if generation != self.generation or upto <= self._summary[1] or upto > len(self.turns):
+            return False
+        self._summary = (summary, upto)
+        self._summary_message = None
+        return True
+
+    def summary_message(self):
+        """The summary as a chat message, shared by every agent's prompt."""
+        message = self._summary_message
+        if message is None:
+            from langchain_core.messages import HumanMessage
+            
+            message = self._summary_message = HumanMessage(content=f"{self.SUMMARY_HEADER} {self.summary}")
+        return message
+
+    def messages(self, start: int, viewer: str) -> list:
+        """Turns from `start` on as chat messages in `viewer`'s prompt.
+        
+        A slice of the shared user forms, with `viewer`'s own turns swapped
+        for their assistant forms.
+        """
+        from langchain_core.messages import AIMessage, HumanMessage
+        
+        with self._lock:
+            for index in range(len(self._user), len(self.turns)):
+                turn = self.turns[index]
+                self._user.append(HumanMessage(content=f"{turn.speaker}: {turn.message}"))
+                self._assistant.append(AIMessage(content=turn.message))
+                self._spoken.setdefault(turn.speaker, []).append(index)
+            messages = self._user[start:]
+            spoken = self._spoken.get(viewer, ())
+            for index in spoken[bisect.bisect_left(spoken, start):]:
+                messages[index - start] = self._assistant[index]
+        return messages
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def __iter__(self):
+        return iter(self.turns)
+
+    def __getitem__(self, index):
+        return self.turns[index]
+
+    def append(self, speaker: str, message: str) -> Turn:
+        turn = Turn(speaker, message)
+        self.turns.append(turn)
+        return turn
+
+    def extend(self, turns: List[Tuple[str, str]]) -> None:
+        """Append many turns at once."""
+        self.turns.extend(Turn(speaker, message) for speaker, message in turns)
+
+
+class HistoryCompactor:
+    """Folds older turns into a running "story so far" summary.
+    
+    Every `every` new turns, everything except the last `keep_recent` turns is
+    summarized by a background worker, off the critical path of `step()`.
+    Agents then see the summary plus the recent window, which keeps prompt
+    size roughly constant however long the game runs.
+    """
+    
+    def __init__(self, model: "ChatOpenAI", every: int = 10, keep_recent: int = 6, word_limit: int = 150) -> None:
+        self.model = model
+        self.every = max(1, every)
+        self.keep_recent = max(0, keep_recent)
+        self.word_limit = word_limit
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compactor")
+        self._lock = threading.Lock()
+        self._pending = False
+
+    def maybe_compact(self, transcript: Transcript) -> None:
+        """Schedule a background summary if enough new turns have piled up."""
+        upto = len(transcript) - self.keep_recent
+        summary, summarized = transcript.summary, transcript.summarized_turns
+        if upto - summarized < self.every:
+            return
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        turns = transcript.turns[summarized:upto]
+        self._executor.submit(self._compact, transcript, summary, turns, upto, transcript.generation)
+
+    def _compact(self, transcript: Transcript, summary: str, turns: List[Turn], upto: int, generation: int) -> None:
+        try:
+            transcript.fold(self.summarize(summary, turns), upto, generation)
+        finally:
+            with self._lock:
+                self._pending = False
+
+    def summarize(self, summary: str, turns: List[Turn]) -> str:
+        from langchain_core.messages import HumanMessage, SystemMessage
+        
+        new_events = "\n".join(f"{turn.speaker}: {turn.message}" for turn in turns)
+        response = self.model.invoke(
+            [
+                SystemMessage(content="You keep a concise record of a Dungeons & Dragons game."),
+                HumanMessage(
+                    content=f"""Story so far: {summary or "The adventure has just begun."}
+            New events:
+            {new_events}
+            Rewrite the story so far to include the new events, in {self.word_limit} words or less.
+            Keep every fact the players may need later: places, items found, promises and open goals.
+            Do not add anything else."""
+                ),
+            ]
+        )
+        return response.content
+
+
+class DialogueAgent:
+    """Agent that can participate in conversations.
+    
+    Prompts are laid out for provider-side prompt caching: the system
+    message (shared game description first, then the role) followed by one
+    chat message per turn, so each call's prompt starts with the exact bytes
+    of the agent's previous prompt. The agent's own turns are assistant
+    messages; everyone else's are user messages prefixed with the speaker.
+    
+    With a `word_limit`, replies are capped with `max_tokens`, stopped at
+    the `stop` sequences (other speakers' prefixes, set by the simulator)
+    and trimmed to the limit at a sentence end before they are committed.
+    
+    With a `memory` (set by the simulator), the prompt instead holds the
+    turns most relevant to the last two plus the most recent turns, so its
+    size stays fixed however long the game runs.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        system_message: "SystemMessage",
+        model: "ChatOpenAI",
+        transcript: Optional[Transcript] = None,
+        word_limit: Optional[int] = None
+    ) -> None:
+        self.name = name
+        self.system_message = system_message
+        self.model = model
+        self.prefix = f"{self.name}: "
+        self.word_limit = word_limit
+        self.stop: List[str] = []
+        self.memory: Optional["VectorMemory"] = None
+        self.ledger: Optional[UsageLedger] = None
+        self.attach(transcript if transcript is not None else Transcript())
+
+    def attach(self, transcript: Transcript) -> None:
+        """Read the conversation from a (shared) transcript."""
+        self.transcript = transcript
+        self.reset()
+
+    def reset(self):
+        # The agent only sees turns committed after its cursor
+        self._cursor = len(self.transcript)
+
+    @property
+    def message_history(self) -> List[str]:
+        return [Transcript.HEADER] + [
+            f"{turn.speaker}: {turn.message}" for turn in self.transcript.turns[self._cursor:]
+        ]
+
+    def _prompt(self) -> list:
+        messages = self._recalled_messages() if self.memory is not None else self._history_messages()
+        messages.insert(0, self.system_message)
+        return messages
+
+    def _history_messages(self) -> list:
+        """The visible conversation as chat messages: the summary (if any) and the turns after it.
+        
+        The messages themselves live on the shared transcript; only the
+        list is built per call.
+        """
+        transcript = self.transcript
+        start = max(self._cursor, transcript.summarized_turns)
+        messages = transcript.messages(start, self.name)
+        if transcript.summarized_turns > self._cursor:
+            messages.insert(0, transcript.summary_message())
+        return messages
+
+    def _recalled_messages(self) -> list:
+        """The summary (if any), the earlier turns most relevant to the last two, and the recent turns."""
+        from langchain_core.messages import HumanMessage
+        
+        transcript, memory = self.transcript, self.memory
+        memory.sync(transcript)
+        turns = transcript.turns
+        summarized = transcript.summarized_turns
+        start = max(self._cursor, summarized)
+        recent_from = max(start, len(turns) - memory.recent)
+        
+        messages = []
+        if summarized > self._cursor:
+            messages.append(transcript.summary_message())
+        if recent_from > start:
+            query = "\n".join(f"{turn.speaker}: {turn.message}" for turn in turns[-2:])
+            recalled = [turns[i] for i in memory.search(query, memory.top_k, start, recent_from)]
+            if recalled:
+                lines = "\n".join(f"{turn.speaker}: {turn.message}" for turn in recalled)
+                messages.append(HumanMessage(content=f"{Transcript.RECALL_HEADER}\n{lines}"))
+        messages.extend(transcript.messages(recent_from, self.name))
+        return messages
+
+    def _call_options(self) -> Dict:
+        options = {}
+        if self.stop:
+            options["stop"] = self.stop
+        if self.word_limit is not None:
+            options["max_tokens"] = max_tokens_for(self.word_limit)
+        return options
+
+    def _finish(self, message) -> Tuple[str, bool]:
+        """The reply to commit, trimmed to the word limit, and whether it was trimmed."""
+        content = message.content if message is not None else ""
+        if self.word_limit is None:
+            return content, False
+        finish_reason = (getattr(message, "response_metadata", None) or {}).get("finish_reason")
+        return trim_response(content, self.word_limit, cut=finish_reason == "length")
+
+    def send(self) -> str:
+        prompt = self._prompt()
+        started = time.perf_counter()
+        message = self.model.invoke(prompt, **self._call_options())
+        latency = time.perf_counter() - started
+        content, trimmed = self._finish(message)
+        self._record(prompt, latency, latency, message.content, message, trimmed)
+        return content
+
+    async def asend(self, limit: Optional[asyncio.Semaphore] = None) -> str:
+        """Async `send()` over the model's `ainvoke()`; holds `limit`, if given, for the duration of the call."""
+        prompt = self._prompt()
+        async with limit if limit is not None else contextlib.nullcontext():
+            started = time.perf_counter()
+            message = await self.model.ainvoke(prompt, **self._call_options())
+            latency = time.perf_counter() - started
+        content, trimmed = self._finish(message)
+        self._record(prompt, latency, latency, message.content, message, trimmed)
+        return content
+
+    def stream(self) -> Generator[str, None, str]:
+        """Yield the response text chunk by chunk as the model produces it.
+        
+        Returns (as the generator's value) the reply to commit, which may be
+        trimmed to the word limit.
+        """
+        prompt = self._prompt()
+        started = time.perf_counter()
+        ttft = None
+        aggregate = None
+        for chunk in self.model.stream(prompt, **self._call_options()):
+            aggregate = chunk if aggregate is None else aggregate + chunk
+            if chunk.content:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                yield chunk.content
+        latency = time.perf_counter() - started
+        content, trimmed = self._finish(aggregate)
+        self._record(
+            prompt, latency, latency if ttft is None else ttft,
+            aggregate.content if aggregate is not None else "", aggregate, trimmed
+        )
+        return content
+
+    def _record(self, prompt: list, latency: float, ttft: float, content: str, message, trimmed: bool) -> None:
+        if self.ledger is None:
+            return
+        self.ledger.record(
+            turn=len(self.transcript),
+            agent=self.name,
+            model=(
+                getattr(self.model, "served_model_name", None)
+                or getattr(self.model, "model_name", None)
+                or type(self.model).__name__
+            ),
+            latency=latency,
+            ttft=ttft,
+            prompt=prompt,
+            completion_text=content,
+            message=message,
+            truncated=trimmed,
+        )
+
+
+class DialogueSimulator:
+    """Manages the conversation flow between agents.
+    
+    With `simultaneous`, play goes in rounds instead of alternating the
+    storyteller with one character: after each narration every character
+    acts at once, generated concurrently against the same transcript, and
+    the storyteller then resolves all of their actions in one response.
+    Use `advance()` to play the next turn or round in either mode.
+    
+    `astep()`, `aadvance()`, `ainject()` and `arun()` are the async
+    counterparts, built on the models' `ainvoke()`, so many games can run as
+    coroutines on one event loop. Passing one `asyncio.Semaphore` as `limit`
+    to several games bounds their model calls in flight.
+    """
+    
+    def __init__(
+        self,
+        agents: List[DialogueAgent],
+        selection_function: Callable[[int, List[DialogueAgent]], int],
+        compactor: Optional[HistoryCompactor] = None,
+        ledger: Optional[UsageLedger] = None,
+        prefetch: bool = False,
+        simultaneous: bool = False,
+        memory: Optional["VectorMemory"] = None,
+    ) -> None:
+        self.agents = agents
+        self._step = 0
+        self.select_next_speaker = selection_function
+        self.compactor = compactor
+        self.transcript = Transcript()
+        self.ledger = ledger if ledger is not None else UsageLedger()
+        for agent in self.agents:
+            agent.attach(self.transcript)
+            agent.ledger = self.ledger
+            agent.stop = stop_sequences(agent, self.agents)
+            agent.memory = memory
+        self.memory = memory
+        self._listeners: List[Callable[[Turn], None]] = []
+        self.prefetch_enabled = prefetch
+        self._prefetch_executor: Optional[ThreadPoolExecutor] = None
+        # (state key, future) for the speculatively generated next turn or round
+        self._prefetched: Optional[Tuple[tuple, Future]] = None
+        self.simultaneous = simultaneous
+        self._party_executor: Optional[ThreadPoolExecutor] = None
+        # The model routing the agents were built with, if known (kept in snapshots)
+        self.routing: Optional[RoutingConfig] = None
+        # Transcript length at which the game is over, if known; no turn is prefetched past it
+        self.max_turns: Optional[int] = None
+
+    def reset(self):
+        self.cancel_prefetch()
+        self.transcript.clear()
+        for agent in self.agents:
+            agent.reset()
+
+    def restore(self, turns: List[Tuple[str, str]]) -> None:
+        """Replace the conversation with previously recorded turns, without calling any model."""
+        self.reset()
+        self.transcript.extend(turns)
+        self._step = len(self.transcript)
+
+    def add_listener(self, listener: Callable[[Turn], None]) -> None:
+        """Call `listener(turn)` after every committed turn (from whichever thread commits it)."""
+        self._listeners = self._listeners + [listener]
+
+    def remove_listener(self, listener: Callable[[Turn], None]) -> None:
+        # Rebinding keeps a commit already iterating the old list safe
+        self._listeners = [other for other in self._listeners if other is not listener]
+
+    @property
+    def listeners(self) -> Tuple[Callable[[Turn], None], ...]:
+        return tuple(self._listeners)
+
+    def inject(self, name: str, message: str):
+        self.cancel_prefetch()
+        turn = self.transcript.append(name, message)
+        self._step += 1
+        self._after_commit(turn)
+
+    @property
+    def next_speaker(self) -> DialogueAgent:
+        if self.simultaneous:
+            return self.next_speakers[0]
+        return self.agents[self.select_next_speaker(self._step, self.agents)]
+
+    @property
+    def next_speakers(self) -> List[DialogueAgent]:
+        """The agents who act in the next `advance()`: one agent, or the whole party in a simultaneous round."""
+        if not self.simultaneous:
+            return [self.next_speaker]
+        storyteller = self.agents[0]
+        if self.transcript.turns and self.transcript.turns[-1].speaker == storyteller.name:
+            return self.agents[1:]
+        return [storyteller]
+
+    def _state_key(self) -> tuple:
+        return (self.transcript.generation, len(self.transcript), self._step, self.simultaneous)
+
+    @property
+    def finished(self) -> bool:
+        return self.max_turns is not None and len(self.transcript) >= self.max_turns
+
+    def prefetch(self) -> None:
+        """Start generating the next turn in the background, unless the game is finished.
+        
+        The next speaker is fully determined by the step counter, so its
+        response can be computed while the user is still reading. `step()`
+        and `stream_step()` then commit the ready result. Any commit or reset
+        in the meantime invalidates it.
+        """
+        if self.finished:
+            return
+        key = self._state_key()
+        if self._prefetched is not None and self._prefetched[0] == key:
+            return
+        self.cancel_prefetch()
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._prefetched = (key, self._prefetch_executor.submit(self._generate, self.next_speakers))
+
+    def cancel_prefetch(self) -> None:
+        """Drop a pending prefetch; a call already in flight finishes but its result is discarded."""
+        if self._prefetched is not None:
+            self._prefetched[1].cancel()
+            self._prefetched = None
+
+    @property
+    def prefetch_ready(self) -> bool:
+        return (
+            self._prefetched is not None
+            and self._prefetched[0] == self._state_key()
+            and self._prefetched[1].done()
+        )
+
+    def _take_prefetched(self, speakers: int = 1) -> Optional[List[str]]:
+        """Return the prefetched messages for the current state, waiting for them if still running."""
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is None:
+            return None
+        key, future = prefetched
+        if key != self._state_key():
+            future.cancel()
+            return None
+        try:
+            messages = future.result()
+        except Exception:
+            # Fall back to a regular call
+            return None
+        return messages if len(messages) == speakers else None
+
+    def _generate(self, speakers: List[DialogueAgent]) -> List[str]:
+        """Responses of `speakers` to the current transcript, generated concurrently."""
+        if len(speakers) == 1:
+            return [speakers[0].send()]
+        if self._party_executor is None:
+            self._party_executor = ThreadPoolExecutor(
+                max_workers=len(self.agents), thread_name_prefix="party"
+            )
+        return list(self._party_executor.map(DialogueAgent.send, speakers))
+
+    def step(self) -> tuple:
+        speaker = self.next_speaker
+        messages = self._take_prefetched()
+        message = messages[0] if messages is not None else speaker.send()
+        
+        turn = self.transcript.append(speaker.name, message)
+        
+        self._step += 1
+        self._after_commit(turn)
+        return speaker.name, message
+
+    def advance(self) -> List[Tuple[str, str]]:
+        """Play the next turn, or in simultaneous mode possibly a whole party round.
+        
+        Party actions are committed together, in roster order, once all of
+        them are generated. Returns [(speaker name, message), ...] committed.
+        """
+        speakers = self.next_speakers
+        if len(speakers) == 1:
+            return [self.step()]
+        messages = self._take_prefetched(len(speakers))
+        if messages is None:
+            messages = self._generate(speakers)
+        return self._commit_round(speakers, messages)
+
+    def _commit_round(self, speakers: List[DialogueAgent], messages: List[str]) -> List[Tuple[str, str]]:
+        turns = [self.transcript.append(speaker.name, message) for speaker, message in zip(speakers, messages)]
+        
+        self._step += len(turns)
+        for i, turn in enumerate(turns):
+            self._after_commit(turn, prefetch=i == len(turns) - 1)
+        return [(turn.speaker, turn.message) for turn in turns]
+
+    async def ainject(self, name: str, message: str) -> None:
+        """Async counterpart of `inject()`; no model is called, so the turn is committed right away."""
+        self.inject(name, message)
+
+    async def _atake_prefetched(self, speakers: int = 1) -> Optional[List[str]]:
+        """`_take_prefetched()` without blocking the event loop on a prefetch still running."""
+        prefetched = self._prefetched
+        if prefetched is not None and prefetched[0] == self._state_key() and not prefetched[1].done():
+            await asyncio.wait({asyncio.wrap_future(prefetched[1])})
+        return self._take_prefetched(speakers)
+
+    async def astep(self, limit: Optional[asyncio.Semaphore] = None) -> tuple:
+        """Async `step()`."""
+        speaker = self.next_speaker
+        messages = await self._atake_prefetched()
+        message = messages[0] if messages is not None else await speaker.asend(limit)
+        
+        turn = self.transcript.append(speaker.name, message)
+        
+        self._step += 1
+        self._after_commit(turn)
+        return speaker.name, message
+
+    async def aadvance(self, limit: Optional[asyncio.Semaphore] = None) -> List[Tuple[str, str]]:
+        """Async `advance()`; a party round's actions are generated concurrently on the event loop."""
+        speakers = self.next_speakers
+        if len(speakers) == 1:
+            return [await self.astep(limit)]
+        messages = await self._atake_prefetched(len(speakers))
+        if messages is None:
+            messages = await asyncio.gather(*(speaker.asend(limit) for speaker in speakers))
+        return self._commit_round(speakers, list(messages))
+
+    async def arun(
+        self, max_iterations: int, limit: Optional[asyncio.Semaphore] = None
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """Play at least `max_iterations` more turns, yielding (speaker name, message) as each is committed.
+        
+        In simultaneous mode the last round is played in full, so a few more
+        turns than `max_iterations` may be yielded.
+        """
+        played = 0
+        while played < max_iterations:
+            for turn in await self.aadvance(limit):
+                played += 1
+                yield turn
+
+    def stream_step(self) -> Generator[str, None, tuple]:
+        """Streaming variant of `step()`.
+        
+        Yields the next speaker's response chunk by chunk. The full message
+        (trimmed to the word limit, if any) is committed to the transcript
+        only once the stream is exhausted, and
+        (speaker name, message) is returned as the generator's value.
+        """
+        speaker = self.next_speaker
+        messages = self._take_prefetched()
+        if messages is not None:
+            message = messages[0]
+            yield message
+        else:
+            message = yield from speaker.stream()
+        
+        turn = self.transcript.append(speaker.name, message)
+        
+        self._step += 1
+        self._after_commit(turn)
+        return speaker.name, message
+
+    def _after_commit(self, turn: Turn, prefetch: bool = True) -> None:
+        for listener in self._listeners:
+            listener(turn)
+        if self.compactor is not None:
+            self.compactor.maybe_compact(self.transcript)
+        if prefetch and self.prefetch_enabled:
+            self.prefetch()
+
+
+class AutoPlayer:
+    """Plays a simulator forward on a background thread until `max_iterations`.
+    
+    Turns are committed to the simulator's transcript as they finish, so a
+    UI only has to render the new tail of the transcript. Supports pause,
+    resume, stop and an optional turns-per-second cap.
+    """
+    
+    def __init__(
+        self,
+        simulator: DialogueSimulator,
+        max_iterations: int,
+        turns_per_second: Optional[float] = None,
+        steps_done: int = 0
+    ) -> None:
+        self.simulator = simulator
+        self.max_iterations = max_iterations
+        self.turns_per_second = turns_per_second
+        self.steps_done = steps_done
+        self.error: Optional[BaseException] = None
+        self._running = threading.Event()
+        self._running.set()
+        self._stopped = threading.Event()
+        self._busy = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="autoplay", daemon=True)
+
+    def start(self) -> "AutoPlayer":
+        self._thread.start()
+        return self
+
+    def pause(self) -> None:
+        """Stop after the turn in progress, if any."""
+        self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._running.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    @property
+    def busy(self) -> bool:
+        """True while a turn is being generated."""
+        return self._busy.is_set()
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive()
+
+    @property
+    def finished(self) -> bool:
+        return self.steps_done >= self.max_iterations
+
+    def _run(self) -> None:
+        last_started = 0.0
+        while not self._stopped.is_set() and not self.finished:
+            self._running.wait()
+            if self._stopped.is_set():
+                break
+            if self.turns_per_second:
+                delay = last_started + 1.0 / self.turns_per_second - time.monotonic()
+                if delay > 0 and self._stopped.wait(delay):
+                    break
+            if not self._running.is_set():
+                continue
+            last_started = time.monotonic()
+            self._busy.set()
+            try:
+                self.steps_done += len(self.simulator.advance())
+            except Exception as exc:
+                self.error = exc
+                break
+            finally:
+                self._busy.clear()
+
+
+def stop_sequences(agent: DialogueAgent, agents: List[DialogueAgent]) -> List[str]:
+    """Speaker prefixes that end `agent`'s reply if it starts speaking for someone else.
+    
+    Only MAX_STOP_SEQUENCES fit, so the storyteller comes first, then the
+    agents who speak after `agent` in roster order.
+    """
+    index = agents.index(agent)
+    others = [agents[0]] + agents[index + 1:] + agents[1:index]
+    return [other.prefix.rstrip() for other in others if other is not agent][:MAX_STOP_SEQUENCES]
+
+
+def select_next_speaker(step: int, agents: List[DialogueAgent]) -> int:
+    """Round-robin with storyteller interleaving."""
+    if step % 2 == 0:
+        return 0
+    else:
+        return (step // 2) % (len(agents) - 1) + 1
+
+
+# ===== GAME SETUP =====
+def normalize_prompt(text: str) -> str:
+    """Strip template indentation and blank lines, leaving one instruction per line.
+    
+    Keeps prompts byte-identical across templates and runs, so the shared
+    game description prefix is cacheable by the provider.
+    """
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+
+def build_game_description(quest: str, character_names: List[str], storyteller_name: str) -> str:
+    """Describe the game shared by every prompt."""
+    return normalize_prompt(
+        f"""Here is the topic for a Dungeons & Dragons game: {quest}.
+                The characters are: {', '.join(character_names)}.
+                The story is narrated by the storyteller, {storyteller_name}."""
+    )
+
+
+def generate_character_description(
+    character_name: str,
+    game_description: str,
+    word_limit: int,
+    api_key: str,
+    cache: Optional[LLMCache] = None,
+    routing: Optional[RoutingConfig] = None
+) -> str:
+    """Generate character description using LLM, on the "setup" route."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    
+    player_descriptor_system_message = SystemMessage(
+        content="You can add detail to the description of a Dungeons & Dragons player."
+    )
+    
+    character_specifier_prompt = [
+        player_descriptor_system_message,
+        HumanMessage(
+            content=f"""{game_description}
+            Please reply with a creative description of the character, {character_name}, in {word_limit} words or less. 
+            Speak directly to {character_name}.
+            Do not add anything else."""
+        ),
+    ]
+    
+    llm = (routing or RoutingConfig()).model_for("setup", api_key)
+    if cache is not None:
+        return cache.invoke(llm, character_specifier_prompt)
+    response = llm.invoke(character_specifier_prompt)
+    character_description = response.content
+
+    return character_description
+
+
+def generate_quest_specification(
+    character_names: List[str],
+    game_description: str,
+    storyteller_name: str,
+    word_limit: int,
+    api_key: str,
+    cache: Optional[LLMCache] = None,
+    routing: Optional[RoutingConfig] = None
+) -> str:
+    """Make the quest more specific using LLM, on the "quest" route."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    
+    quest_specifier_prompt = [
+        SystemMessage(content="You can make a task more specific."),
+        HumanMessage(
+            content=f"""{game_description}
+            
+            You are the storyteller, {storyteller_name}.
+            Please make the quest more specific. Be creative and imaginative.
+            Please reply with the specified quest in {word_limit} words or less. 
+            Speak directly to the characters: {', '.join(character_names)}.
+            Do not add anything else."""
+        ),
+    ]
+    
+    llm = (routing or RoutingConfig()).model_for("quest", api_key)
+    if cache is not None:
+        return cache.invoke(llm, quest_specifier_prompt)
+    return llm.invoke(quest_specifier_prompt).content
+
+
+def generate_setup_batch(
+    character_names: List[str],
+    game_description: str,
+    storyteller_name: str,
+    word_limit: int,
+    api_key: str,
+    cache: Optional[LLMCache] = None,
+    routing: Optional[RoutingConfig] = None
+) -> Dict[Tuple[str, Optional[str]], str]:
+    """Ask for every description and the specified quest in one JSON-mode call, on the "setup" route.
+    
+    The reply is validated against a pydantic schema. Returns the entries
+    that came back usable, keyed like `generate_game_setup`'s jobs:
+    ("character", name), ("storyteller", name) and ("quest", None). A
+    failed call, or a reply that cannot be parsed at all, yields no
+    entries; only replies that parse are cached.
+    """
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from pydantic import BaseModel, ValidationError
+    
+    class SetupBatch(BaseModel):
+        characters: Dict[str, str] = {}
+        storyteller: str = ""
+        quest: str = ""
+    
+    names = ", ".join(character_names)
+    setup_prompt = [
+        SystemMessage(content="You can add detail to a Dungeons & Dragons game and make its quest more specific."),
+        HumanMessage(
+            content=f"""{game_description}
+            Please reply with a JSON object with exactly these keys:
+            "characters": an object mapping each character's name ({names}) to a creative description of that character in {word_limit} words or less, spoken directly to them.
+            "storyteller": a creative description of the storyteller, {storyteller_name}, in {word_limit} words or less, spoken directly to {storyteller_name}.
+            "quest": the quest made more specific, creative and imaginative, in {word_limit} words or less, spoken by {storyteller_name} directly to the characters.
+            Do not add anything else."""
+        ),
+    ]
+    
+    def parse(content: str) -> Optional[SetupBatch]:
+        try:
+            # Some models still wrap JSON mode replies in a code fence
+            return SetupBatch.model_validate_json(content.strip().removeprefix("```json").strip("`\n "))
+        except ValidationError:
+            return None
+    
+    llm = (routing or RoutingConfig()).model_for("setup", api_key)
+    options = {"response_format": {"type": "json_object"}}
+    try:
+        if cache is not None:
+            content = cache.invoke(llm, setup_prompt, accept=lambda reply: parse(reply) is not None, **options)
+        else:
+            content = llm.invoke(setup_prompt, **options).content
+    except Exception as exc:
+        # e.g. a model that rejects JSON mode, or a call out of retries
+        logger.warning("Batched setup call failed, generating each entry separately: %r", exc)
+        return {}
+    batch = parse(content)
+    if batch is None:
+        return {}
+    
+    entries: Dict[Tuple[str, Optional[str]], str] = {}
+    for name in character_names:
+        description = batch.characters.get(name, "").strip()
+        if description:
+            entries[("character", name)] = description
+    if batch.storyteller.strip():
+        entries[("storyteller", storyteller_name)] = batch.storyteller.strip()
+    if batch.quest.strip():
+        entries[("quest", None)] = batch.quest.strip()
+    return entries
+
+
+def generate_game_setup(
+    character_names: List[str],
+    game_description: str,
+    storyteller_name: str,
+    word_limit: int,
+    api_key: str,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    max_workers: int = 10,
+    cache: Optional[LLMCache] = None,
+    routing: Optional[RoutingConfig] = None,
+    batched: bool = False
+) -> Tuple[Dict[str, str], str, str]:
+    """Generate all character descriptions, the storyteller description and the quest concurrently.
+    
+    All N+2 requests are submitted at once to a bounded thread pool, so setup
+    costs about one LLM round-trip. ``on_progress(done, total)`` is called from
+    the calling thread as each request finishes. With a `cache`, repeated
+    setups are served from disk without any API calls. Models come from
+    the "setup" and "quest" routes of `routing`.
+    
+    With `batched`, everything is first requested in one structured call
+    (`generate_setup_batch`), sending the game description once instead of
+    N+2 times; only the entries missing from its reply are then requested
+    one by one as above.
+    
+    Returns (character_descriptions, storyteller_description, specified_quest).
+    """
+    total = len(character_names) + 2
+    jobs = [("character", name) for name in character_names] + [("storyteller", storyteller_name), ("quest", None)]
+    
+    results: Dict[Tuple[str, Optional[str]], str] = {}
+    if batched:
+        results = generate_setup_batch(
+            character_names, game_description, storyteller_name, word_limit, api_key, cache, routing
+        )
+        if results and on_progress is not None:
+            on_progress(len(results), total)
+    
+    missing = [job for job in jobs if job not in results]
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as executor:
+            futures = {}
+            for kind, name in missing:
+                if kind == "quest":
+                    future = executor.submit(
+                        generate_quest_specification,
+                        character_names, game_description, storyteller_name, word_limit, api_key, cache, routing
+                    )
+                else:
+                    future = executor.submit(
+                        generate_character_description, name, game_description, word_limit, api_key, cache, routing
+                    )
+                futures[future] = (kind, name)
+            
+            for done, future in enumerate(as_completed(futures), start=len(results) + 1):
+                results[futures[future]] = future.result()
+                if on_progress is not None:
+                    on_progress(done, total)
+    
+    # Keep the roster order regardless of completion order
+    character_descriptions = {name: results[("character", name)] for name in character_names}
+    return character_descriptions, results[("storyteller", storyteller_name)], results[("quest", None)]
+
+
+def generate_character_system_message(
+    character_name: str,
+    character_description: str,
+    game_description: str,
+    storyteller_name: str,
+    word_limit: int
+) -> "SystemMessage":
+    """Create system message for character."""
+    from langchain_core.messages import SystemMessage
+    
+    return SystemMessage(
+        content=normalize_prompt(
+            f"""{game_description}
+    Your name is {character_name}. 
+    Your character description is as follows: {character_description}.
+    You will propose actions you plan to take and {storyteller_name} will explain what happens when you take those actions.
+    Speak in the first person from the perspective of {character_name}.
+    For describing your own body movements, wrap your description in '*'.
+    Do not change roles!
+    Do not speak from the perspective of anyone else.
+    Remember you are {character_name}.
+    Stop speaking the moment you finish speaking from your perspective.
+    Never forget to keep your response to {word_limit} words!
+    Do not add anything else.
+    """
+        )
+    )
+
+
+def generate_storyteller_system_message(
+    storyteller_name: str,
+    storyteller_description: str,
+    game_description: str,
+    word_limit: int,
+    simultaneous: bool = False
+) -> "SystemMessage":
+    """Create system message for the storyteller."""
+    from langchain_core.messages import SystemMessage
+    
+    rounds = (
+        "The players act at the same time; explain what happens when all of their actions are taken, in one response."
+        if simultaneous else ""
+    )
+    return SystemMessage(
+        content=normalize_prompt(
+            f"""{game_description}
+    You are the storyteller, {storyteller_name}. 
+    Your description is as follows: {storyteller_description}.
+    The other players will propose actions to take and you will explain what happens when they take those actions.
+    {rounds}
+    Speak in the first person from the perspective of {storyteller_name}.
+    Do not change roles!
+    Do not speak from the perspective of anyone else.
+    Remember you are the storyteller, {storyteller_name}.
+    Stop speaking the moment you finish speaking from your perspective.
+    Never forget to keep your response to {word_limit} words!
+    Do not add anything else.
+    """
+        )
+    )
+
+
+def create_simulator(
+    character_names: List[str],
+    character_descriptions: Dict[str, str],
+    storyteller_name: str,
+    storyteller_description: str,
+    game_description: str,
+    specified_quest: str,
+    word_limit: int,
+    api_key: str,
+    compact_every: Optional[int] = None,
+    prefetch: bool = False,
+    simultaneous: bool = False,
+    memory_top_k: Optional[int] = None,
+    routing: Optional[RoutingConfig] = None
+) -> DialogueSimulator:
+    """Build the agents and a simulator whose transcript opens with the quest.
+    
+    No LLM calls are made here except, with `prefetch`, the speculative first
+    turn. With `compact_every`, older turns are summarized in the background
+    every that many turns. With `simultaneous`, the party acts in rounds.
+    With `memory_top_k`, prompts hold that many recalled turns plus the
+    recent ones instead of the whole history. Agents' models come from
+    `routing` (the default routes if omitted).
+    """
+    system_messages = [
+        (
+            storyteller_name,
+            generate_storyteller_system_message(
+                storyteller_name, storyteller_description, game_description, word_limit, simultaneous
+            ),
+        )
+    ] + [
+        (
+            character_name,
+            generate_character_system_message(
+                character_name,
+                character_descriptions[character_name],
+                game_description,
+                storyteller_name,
+                word_limit
+            ),
+        )
+        for character_name in character_names
+    ]
+    
+    simulator = assemble_simulator(
+        system_messages,
+        api_key,
+        compact_every=compact_every,
+        prefetch=prefetch,
+        simultaneous=simultaneous,
+        word_limit=word_limit,
+        memory_top_k=memory_top_k,
+        routing=routing
+    )
+    simulator.reset()
+    simulator.inject(storyteller_name, specified_quest)
+    return simulator
+
+
+def assemble_simulator(
+    system_messages: List[Tuple[str, "SystemMessage"]],
+    api_key: str,
+    model: Optional[str] = None,
+    temperature: float = 0.2,
+    compact_every: Optional[int] = None,
+    prefetch: bool = False,
+    simultaneous: bool = False,
+    word_limit: Optional[int] = None,
+    memory_top_k: Optional[int] = None,
+    embedder=None,
+    routing: Optional[RoutingConfig] = None
+) -> DialogueSimulator:
+    """Create one agent per (name, system message), storyteller first, and a simulator over them.
+    
+    Models come from `routing`; without one, every agent uses `model` at
+    `temperature`. With `memory_top_k`, the agents share a VectorMemory
+    over the transcript (embedded with `embedder`, local hashing by default).
+    """
+    routing = routing or RoutingConfig.uniform(model, temperature)
+    agents = [
+        DialogueAgent(
+            name=name,
+            system_message=system_message,
+            model=routing.model_for(
+                "storyteller" if index == 0 else "character", api_key, name, stream_usage=True
+            ),
+            word_limit=word_limit,
+        )
+        for index, (name, system_message) in enumerate(system_messages)
+    ]
+    
+    compactor = None
+    if compact_every:
+        compactor = HistoryCompactor(
+            model=routing.model_for("summary", api_key),
+            every=compact_every,
+            keep_recent=len(agents)
+        )
+    
+    memory = None
+    if memory_top_k:
+        from memory import VectorMemory
+        memory = VectorMemory(embedder=embedder, top_k=memory_top_k, recent=len(agents) + 1)
+    
+    simulator = DialogueSimulator(
+        agents=agents,
+        selection_function=select_next_speaker,
+        compactor=compactor,
+        prefetch=prefetch,
+        simultaneous=simultaneous,
+        memory=memory
+    )
+    simulator.routing = routing
+    return simulator
@@ -0,0 +1,243 @@
+"""
+Fake Chat Model
+===============
+A deterministic, local stand-in for ChatOpenAI, for benchmarks, load tests
+and offline runs. It answers with `words` pseudo-random words chosen from a
+hash of the prompt, in sentences of eight, after `latency` seconds (plus
+`token_latency` per streamed word). It honours `stop` sequences and a
+`max_tokens` call option, counting one token per word. It also keeps
+counters of what it was sent and, like provider-side prompt caching,
+reports the tokens of the longest message prefix it has seen before as
+cached.
+
+For exercising retries and hedging, a `failure_rate` share of calls raise
+a transient ConnectionError and a `tail_rate` share take `tail_latency`
+extra seconds, drawn from a generator seeded with `seed`.
+
+Async calls (`ainvoke()` / `astream()`) wait with `asyncio.sleep`, so many
+fake games can share one event loop without threads.
+"""
+
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+
+VOCABULARY = (
+    "wand castle owl spell dragon torch corridor whisper shadow potion map "
+    "door staircase cloak secret goblet stone portrait lantern key moon "
+    "forest troll library candle broom feather scroll dungeon echo gate"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model with configurable latency and output length."""
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    words: int = 50
+    seed: int = 0
+    model_name: str = "fake"
+    temperature: float = 0.0
+    prompt_caching: bool = True
+    failure_rate: float = 0.0
+    tail_rate: float = 0.0
+    tail_latency: float = 0.0
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: Dict[str, float] = PrivateAttr(default_factory=dict)
+    _prefixes: set = PrivateAttr(default_factory=set)
+    _random: random.Random = PrivateAttr(default_factory=random.Random)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._random.seed(self.seed)
+        self.reset_stats()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Calls made, prompt bytes received and CPU seconds spent inside the model."""
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {"calls": 0, "prompt_bytes": 0, "last_prompt_bytes": 0, "cpu": 0.0, "failures": 0}
+
+    def _reply(self, messages: List[BaseMessage]) -> List[str]:
+        words, fail, slow = self._draw(messages)
+        if fail:
+            time.sleep(self.latency)
+            raise ConnectionError("fake transient failure")
+        if slow:
+            time.sleep(self.tail_latency)
+        return words
+
+    async def _areply(self, messages: List[BaseMessage]) -> List[str]:
+        words, fail, slow = self._draw(messages)
+        if fail:
+            await asyncio.sleep(self.latency)
+            raise ConnectionError("fake transient failure")
+        if slow:
+            await asyncio.sleep(self.tail_latency)
+        return words
+
+    def _draw(self, messages: List[BaseMessage]) -> Tuple[List[str], bool, bool]:
+        """The reply words, and whether this call fails or is slow; updates the counters."""
+        cpu_started = time.process_time()
+        prompt = "".join(str(message.content) for message in messages)
+        size = len(prompt.encode("utf-8"))
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        words = [VOCABULARY[digest[i % len(digest)] % len(VOCABULARY)] for i in range(self.words)]
+        words = [word + "." if i % 8 == 7 or i == len(words) - 1 else word for i, word in enumerate(words)]
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["prompt_bytes"] += size
+            self._stats["last_prompt_bytes"] = size
+            self._stats["cpu"] += time.process_time() - cpu_started
+            fail = self._random.random() < self.failure_rate
+            slow = self._random.random() < self.tail_rate
+            if fail:
+                self._stats["failures"] += 1
+        return words, fail, slow
+
+    def _cached_chars(self, messages: List[BaseMessage]) -> int:
+        """Characters in the longest message prefix seen in an earlier prompt; remembers this prompt's prefixes."""
+        digest = hashlib.sha256()
+        cached = size = 0
+        with self._lock:
+            if len(self._prefixes) > 100_000:
+                self._prefixes.clear()
+            for message in messages:
+                digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+                size += len(str(message.content))
+                key = digest.digest()
+                if key in self._prefixes:
+                    cached = size
+                else:
+                    self._prefixes.add(key)
+        return cached
+
+    def _usage(self, messages: List[BaseMessage], words: List[str]) -> Dict[str, Any]:
+        # Counted as model CPU, like `_draw()`: the prefix hashing runs over the whole prompt
+        cpu_started = time.process_time()
+        # Rough 4-characters-per-token estimate, good enough for accounting tests
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(words)
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        if self.prompt_caching:
+            usage["input_token_details"] = {"cache_read": self._cached_chars(messages) // 4}
+        with self._lock:
+            self._stats["cpu"] += time.process_time() - cpu_started
+        return usage
+
+    @staticmethod
+    def _limit(words: List[str], stop: Optional[List[str]], max_tokens: Optional[int]) -> Tuple[List[str], str]:
+        """Apply `max_tokens` and `stop`; returns the words to send and the finish reason."""
+        finish_reason = "stop"
+        if max_tokens is not None and len(words) > max_tokens:
+            words, finish_reason = words[:max_tokens], "length"
+        text = " ".join(words)
+        cut = min((text.find(s) for s in stop or () if s in text), default=-1)
+        if cut >= 0:
+            words, finish_reason = text[:cut].split(), "stop"
+        return words, finish_reason
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        words, finish_reason = self._limit(self._reply(messages), stop, kwargs.get("max_tokens"))
+        time.sleep(self.latency + self.token_latency * len(words))
+        message = AIMessage(
+            content=" ".join(words),
+            usage_metadata=self._usage(messages, words),
+            response_metadata={"finish_reason": finish_reason},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        words, finish_reason = self._limit(self._reply(messages), stop, kwargs.get("max_tokens"))
+        time.sleep(self.latency)
+        for i, word in enumerate(words):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            content = word if i == 0 else f" {word}"
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=content))
+            if run_manager:
+                run_manager.on_llm_new_token(content, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                usage_metadata=self._usage(messages, words),
+                response_metadata={"finish_reason": finish_reason},
+            )
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        words, finish_reason = self._limit(await self._areply(messages), stop, kwargs.get("max_tokens"))
+        await asyncio.sleep(self.latency + self.token_latency * len(words))
+        message = AIMessage(
+            content=" ".join(words),
+            usage_metadata=self._usage(messages, words),
+            response_metadata={"finish_reason": finish_reason},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        words, finish_reason = self._limit(await self._areply(messages), stop, kwargs.get("max_tokens"))
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(words):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            content = word if i == 0 else f" {word}"
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=content))
+            if run_manager:
+                await run_manager.on_llm_new_token(content, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                usage_metadata=self._usage(messages, words),
+                response_metadata={"finish_reason": finish_reason},
+            )
+        )
@@ -0,0 +1,180 @@
+"""
+Persistent LLM Response Cache
+=============================
+An opt-in, SQLite-backed cache for the setup prompts (character descriptions
+and quest specification), which repeat constantly for the same roster, quest
+and word limit.
+
+Entries are keyed by model, temperature and a hash of the prompt messages.
+Each key can hold up to `variety` samples; once all samples exist, repeated
+calls rotate through them without touching the API. Keys expire after
+`ttl_seconds` and the least recently used keys are evicted beyond
+`max_entries`.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+
+DEFAULT_CACHE_PATH = os.environ.get("DND_CACHE_PATH", ".dnd_cache.sqlite3")
+
+
+class LLMCache:
+    """SQLite-backed response cache with TTL/LRU eviction and sample rotation."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = 1000,
+        ttl_seconds: Optional[float] = 7 * 24 * 3600,
+        variety: int = 1
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.variety = max(1, variety)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    next_sample INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS samples (
+                    key TEXT NOT NULL,
+                    sample INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (key, sample)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection that commits (or rolls back) on exit and is then closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: List["BaseMessage"]) -> str:
+        payload = json.dumps(
+            [model, temperature, [(message.type, message.content) for message in messages]],
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the next cached sample for `key`, or None if a new one should be generated.
+
+        A miss is reported while fewer than `variety` samples are stored, so
+        the caller fills the key up before rotation starts.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT created, next_sample FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            created, next_sample = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._delete(conn, key)
+                return None
+            contents = [
+                content for (content,) in conn.execute(
+                    "SELECT content FROM samples WHERE key = ? ORDER BY sample", (key,)
+                )
+            ]
+            if len(contents) < self.variety:
+                return None
+            content = contents[next_sample % len(contents)]
+            conn.execute(
+                "UPDATE entries SET last_used = ?, next_sample = ? WHERE key = ?",
+                (now, (next_sample + 1) % len(contents), key),
+            )
+            return content
+
+    def put(self, key: str, content: str) -> None:
+        """Store a new sample for `key`, then evict expired and least recently used keys."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO entries (key, created, last_used) VALUES (?, ?, ?)",
+                (key, now, now),
+            )
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+            (count,) = conn.execute("SELECT COUNT(*) FROM samples WHERE key = ?", (key,)).fetchone()
+            if count < self.variety:
+                conn.execute(
+                    "INSERT INTO samples (key, sample, content) VALUES (?, ?, ?)", (key, count, content)
+                )
+            self._evict(conn, now)
+
+    def invoke(
+        self,
+        llm,
+        messages: List["BaseMessage"],
+        accept: Optional[Callable[[str], bool]] = None,
+        **kwargs
+    ) -> str:
+        """Return a cached response for `messages`, calling `llm` (with call options `kwargs`) only on a miss.
+
+        A new response that `accept` rejects is returned but not stored.
+        """
+        key = self.make_key(
+            getattr(llm, "model_name", type(llm).__name__),
+            getattr(llm, "temperature", None),
+            messages,
+        )
+        content = self.get(key)
+        if content is None:
+            content = llm.invoke(messages, **kwargs).content
+            if accept is None or accept(content):
+                self.put(key, content)
+        return content
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM samples")
+            conn.execute("DELETE FROM entries")
+
+    def __len__(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        if self.ttl_seconds is not None:
+            conn.execute(
+                "DELETE FROM samples WHERE key IN (SELECT key FROM entries WHERE created < ?)",
+                (now - self.ttl_seconds,),
+            )
+            conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+        stale = conn.execute(
+            "SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+        ).fetchall()
+        for (key,) in stale:
+            self._delete(conn, key)
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, key: str) -> None:
+        conn.execute("DELETE FROM samples WHERE key = ?", (key,))
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
@@ -0,0 +1,190 @@
+"""
+Multi-Agent D&D Game - Load Test
+================================
+Drives K simulated players through the Streamlit app (`dnd.py`) with
+Streamlit's AppTest, against the local fake chat model (`DND_FAKE_LLM=1`,
+see `clients`), to measure how many players one server process can hold.
+
+Each simulated session opens the app, enters an API key, starts an
+adventure, clicks Next Turn `--turns` times and finally resets the game.
+All K sessions are live at once and take their clicks in turn: AppTest
+runs one script at a time per process (its runtime is a process-wide
+singleton), which is also how reruns contend for the one interpreter of a
+real server. For each K it reports:
+    - per-rerun latency percentiles (every click is one script rerun)
+    - process memory growth per session, and the SessionManager's own
+      estimate, measured while all K games are live
+    - throughput in reruns and game turns per second
+
+The sessions share the process-wide SessionManager and client registry,
+as browser sessions of one server do.
+
+Run:
+    python loadtest.py
+    python loadtest.py --sessions 1 8 32 --turns 10 --latency 0.2 --json
+"""
+
+import argparse
+import gc
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from bench import format_table
+from metrics import percentile
+
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dnd.py")
+
+
+def _rss_bytes() -> int:
+    """Current resident set size, or the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _button(elements, label: str):
+    return next(button for button in elements if label in button.label)
+
+
+class Player:
+    """One simulated browser session of the app."""
+
+    def __init__(self, timeout: float) -> None:
+        from streamlit.testing.v1 import AppTest
+
+        self.app = AppTest.from_file(APP, default_timeout=timeout)
+        self.turns = 0
+        self.failed = False
+
+    def _rerun(self, action: Callable[[], None], reruns: List[float]) -> None:
+        if self.failed:
+            return
+        started = time.perf_counter()
+        try:
+            action()
+            if self.app.exception:
+                raise RuntimeError(self.app.exception[0].message)
+        except Exception:
+            self.failed = True
+            return
+        reruns.append(time.perf_counter() - started)
+
+    def start(self, reruns: List[float]) -> None:
+        self._rerun(self.app.run, reruns)
+        self._rerun(lambda: self.app.sidebar.text_input[0].input("sk-load-test").run(), reruns)
+        self._rerun(lambda: _button(self.app.sidebar.button, "Start Adventure").click().run(), reruns)
+
+    def next_turn(self, reruns: List[float]) -> None:
+        self._rerun(lambda: _button(self.app.button, "Next Turn").click().run(), reruns)
+        if not self.failed:
+            self.turns += 1
+
+    def reset(self, reruns: List[float]) -> None:
+        self._rerun(lambda: _button(self.app.sidebar.button, "Reset Game").click().run(), reruns)
+
+
+def run_level(sessions: int, turns: int, timeout: float) -> Dict:
+    """Play `sessions` live sessions and summarize rerun latency, memory and throughput."""
+    from sessions import default_manager
+
+    gc.collect()
+    rss_before = _rss_bytes()
+    reruns: List[float] = []
+    started = time.perf_counter()
+
+    players = [Player(timeout) for _ in range(sessions)]
+    for player in players:
+        player.start(reruns)
+    for _ in range(turns):
+        for player in players:
+            player.next_turn(reruns)
+
+    # Every game is live now; measure before they are reset
+    gc.collect()
+    rss_live = _rss_bytes()
+    game_bytes = default_manager().memory_bytes()
+    for player in players:
+        player.reset(reruns)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "sessions": sessions,
+        "reruns": len(reruns),
+        "rerun_p50_ms": percentile(reruns, 50) * 1e3,
+        "rerun_p95_ms": percentile(reruns, 95) * 1e3,
+        "rerun_p99_ms": percentile(reruns, 99) * 1e3,
+        "rss_mb_per_session": max(0, rss_live - rss_before) / sessions / 2**20,
+        "game_mb_per_session": game_bytes / sessions / 2**20,
+        "reruns_per_s": len(reruns) / elapsed,
+        "turns_per_s": sum(player.turns for player in players) / elapsed,
+        "errors": sum(player.failed for player in players),
+        "wall_s": elapsed,
+    }
+
+
+# (title, result key, format spec) of each table column
+COLUMNS = [
+    ("sessions", "sessions", "d"),
+    ("reruns", "reruns", "d"),
+    ("rerun p50 ms", "rerun_p50_ms", ".1f"),
+    ("rerun p95 ms", "rerun_p95_ms", ".1f"),
+    ("rerun p99 ms", "rerun_p99_ms", ".1f"),
+    ("RSS MB/session", "rss_mb_per_session", ".2f"),
+    ("game MB/session", "game_mb_per_session", ".3f"),
+    ("reruns/s", "reruns_per_s", ".1f"),
+    ("turns/s", "turns_per_s", ".1f"),
+    ("errors", "errors", "d"),
+    ("wall s", "wall_s", ".2f"),
+]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app with many simulated players.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16], help="Live sessions (K) to test")
+    parser.add_argument("--turns", type=int, default=5, help="Next Turn clicks per session")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency per call, in seconds")
+    parser.add_argument("--words", type=int, default=40, help="Words per fake response")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds a single rerun may take")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    os.environ["DND_FAKE_LLM"] = "1"
+    os.environ["DND_FAKE_LATENCY"] = str(args.latency)
+    os.environ["DND_FAKE_WORDS"] = str(args.words)
+    # Keep the load test's autosaves out of the real saved games, and remove them afterwards
+    save_dir = None
+    if "DND_SAVE_DIR" not in os.environ:
+        save_dir = os.environ["DND_SAVE_DIR"] = tempfile.mkdtemp(prefix="dnd-loadtest-")
+
+    try:
+        # Warm up imports and caches so the first level is not charged for them
+        run_level(1, 1, args.timeout)
+
+        results = []
+        for sessions in args.sessions:
+            result = run_level(sessions, args.turns, args.timeout)
+            results.append(result)
+            if args.json:
+                print(json.dumps(result))
+    finally:
+        if save_dir is not None:
+            shutil.rmtree(save_dir, ignore_errors=True)
+
+    if not args.json:
+        print(format_table(results, COLUMNS))
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Retrieval Memory
+================
+A local vector index over the transcript, so very long games can send a
+fixed-size prompt: the turns most relevant to the current moment plus the
+last few turns, instead of the whole history.
+
+Turns are embedded once, as they are committed, and appended to a NumPy
+matrix; nothing already indexed is embedded again. Embeddings come from a
+pluggable embedder: anything with `embed(texts) -> array` of unit rows.
+The default HashingEmbedder runs locally with no model or network; wrap a
+LangChain `Embeddings` (e.g. OpenAIEmbeddings) in LangChainEmbedder for
+semantic embeddings.
+"""
+
+import hashlib
+import re
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from engine import Transcript
+
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from he her his i in is it its me my of on or our she so that the "
+    "their them they this to was we were what will with you your".split()
+)
+
+
+@lru_cache(maxsize=65536)
+def _bucket(feature: str, dim: int) -> Tuple[int, float]:
+    digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return digest % dim, 1.0 if digest >> 63 else -1.0
+
+
+class HashingEmbedder:
+    """Local embedder: word unigrams and bigrams hashed into `dim` signed buckets.
+
+    Matches turns that share names, places and items, which is what keeps
+    a long story consistent; it has no notion of synonyms.
+    """
+
+    def __init__(self, dim: int = 1024) -> None:
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                index, sign = _bucket(feature, self.dim)
+                vectors[row, index] += sign
+        return _normalize(vectors)
+
+
+class LangChainEmbedder:
+    """Adapts a LangChain `Embeddings` object to the embedder interface."""
+
+    def __init__(self, embeddings) -> None:
+        self.embeddings = embeddings
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return _normalize(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+
+
+class VectorMemory:
+    """Append-only vector index of a transcript's turns, searched by cosine similarity.
+
+    Agents using it see up to `top_k` relevant earlier turns plus the last
+    `recent` turns.
+    """
+
+    def __init__(self, embedder=None, top_k: int = 6, recent: int = 6) -> None:
+        self.embedder = embedder if embedder is not None else HashingEmbedder()
+        self.top_k = top_k
+        self.recent = recent
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._count = 0
+        self._generation: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self._vectors is None else self._vectors.nbytes
+
+    def sync(self, transcript: "Transcript") -> None:
+        """Embed and index the turns committed since the last sync."""
+        with self._lock:
+            if transcript.generation != self._generation:
+                self._vectors, self._count, self._generation = None, 0, transcript.generation
+            turns = transcript.turns[self._count:]
+            if not turns:
+                return
+            vectors = self.embedder.embed([f"{turn.speaker}: {turn.message}" for turn in turns])
+            needed = self._count + len(vectors)
+            if self._vectors is None or needed > len(self._vectors):
+                # Grow by doubling so appends stay amortized O(1)
+                grown = np.zeros((max(64, 2 * needed), vectors.shape[1]), dtype=np.float32)
+                if self._vectors is not None:
+                    grown[:self._count] = self._vectors[:self._count]
+                self._vectors = grown
+            self._vectors[self._count:needed] = vectors
+            self._count = needed
+
+    def search(self, query: str, k: int, start: int = 0, stop: Optional[int] = None) -> List[int]:
+        """Indices of the `k` turns in [start, stop) most similar to `query`, in transcript order."""
+        with self._lock:
+            stop = self._count if stop is None else min(stop, self._count)
+            if k <= 0 or stop <= start:
+                return []
+            candidates = self._vectors[start:stop]
+        scores = candidates @ self.embedder.embed([query])[0]
+        if k < len(scores):
+            best = np.argpartition(-scores, k)[:k]
+        else:
+            best = np.arange(len(scores))
+        return sorted(start + int(i) for i in best if scores[i] > 0)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
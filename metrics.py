@@ -0,0 +1,240 @@
+"""
+Usage Metrics
+=============
+Per-call latency, token and cost accounting for dialogue agents.
+
+Every `DialogueAgent.send()` / `stream()` call adds a CallRecord to the
+game's UsageLedger: wall-clock latency, time to first token, prompt,
+cached prompt and completion tokens and an estimated cost. Token counts
+come from the response's usage metadata when the provider reports it, and
+from `tiktoken` otherwise (in which case no tokens count as cached).
+"""
+
+import csv
+import io
+import statistics
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+# USD per 1M (prompt, cached prompt, completion) tokens
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "fake": (0.0, 0.0, 0.0),
+}
+
+_encodings = {}
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """The q-th percentile (0-100, in whole steps) of `values`; 0.0 for no values."""
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[max(0, min(98, int(q) - 1))]
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Count tokens with tiktoken, or estimate at 4 characters per token if unavailable."""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            import tiktoken
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # tiktoken missing, or its encoding file cannot be fetched
+            encoding = False
+        _encodings[model] = encoding
+    if encoding is False:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """Estimated USD cost; models are matched by longest known name prefix.
+
+    `cached_tokens` are the part of `prompt_tokens` served from the provider's prompt cache.
+    """
+    prices = None
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            prices = MODEL_PRICES[name]
+            break
+    if prices is None:
+        return 0.0
+    uncached = prompt_tokens - cached_tokens
+    return (uncached * prices[0] + cached_tokens * prices[1] + completion_tokens * prices[2]) / 1e6
+
+
+def usage_from_message(message) -> Optional[Tuple[int, int, int]]:
+    """Return (prompt tokens, completion tokens, cached prompt tokens) reported by the provider, if any."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0), cached or 0
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if token_usage:
+        cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0), cached or 0
+    return None
+
+
+class CallRecord:
+    """Measurements for one agent response."""
+
+    __slots__ = (
+        "turn", "agent", "model", "latency", "ttft", "prompt_tokens", "cached_tokens", "completion_tokens", "cost",
+        "truncated",
+    )
+
+    def __init__(
+        self,
+        turn: int,
+        agent: str,
+        model: str,
+        latency: float,
+        ttft: float,
+        prompt_tokens: int,
+        cached_tokens: int,
+        completion_tokens: int,
+        cost: float,
+        truncated: bool = False
+    ) -> None:
+        self.turn = turn
+        self.agent = agent
+        self.model = model
+        self.latency = latency
+        self.ttft = ttft
+        self.prompt_tokens = prompt_tokens
+        self.cached_tokens = cached_tokens
+        self.completion_tokens = completion_tokens
+        self.cost = cost
+        self.truncated = truncated
+
+    @property
+    def cache_ratio(self) -> float:
+        """Share of this call's prompt tokens served from the provider's prompt cache."""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def as_row(self) -> List:
+        return [getattr(self, field) for field in self.__slots__]
+
+
+class UsageLedger:
+    """Thread-safe collection of CallRecords for one game session."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.records: List[CallRecord] = []
+
+    def record(
+        self,
+        turn: int,
+        agent: str,
+        model: str,
+        latency: float,
+        ttft: float,
+        prompt: list,
+        completion_text: str,
+        message=None,
+        truncated: bool = False
+    ) -> CallRecord:
+        """Add a record, taking token counts from `message` metadata when available.
+
+        `prompt` is the list of messages sent; it is only joined and counted
+        when the metadata is missing. `truncated` marks a reply that was
+        trimmed to the word limit.
+        """
+        usage = usage_from_message(message) if message is not None else None
+        if usage is None:
+            prompt_text = "\n".join(str(m.content) for m in prompt)
+            usage = (count_tokens(prompt_text, model), count_tokens(completion_text, model), 0)
+        prompt_tokens, completion_tokens, cached_tokens = usage
+        record = CallRecord(
+            turn, agent, model, latency, ttft, prompt_tokens, cached_tokens, completion_tokens,
+            estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens), truncated,
+        )
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def percentile(self, field: str, q: float, agent: Optional[str] = None) -> float:
+        """The q-th percentile (0-100) of `field`, optionally for one agent only."""
+        with self._lock:
+            values = [getattr(r, field) for r in self.records if agent is None or r.agent == agent]
+        return percentile(values, q)
+
+    def totals(self, agent: Optional[str] = None) -> Dict[str, float]:
+        with self._lock:
+            records = [r for r in self.records if agent is None or r.agent == agent]
+        prompt_tokens = sum(r.prompt_tokens for r in records)
+        cached_tokens = sum(r.cached_tokens for r in records)
+        return {
+            "calls": len(records),
+            "latency": sum(r.latency for r in records),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "cache_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+            "completion_tokens": sum(r.completion_tokens for r in records),
+            "cost": sum(r.cost for r in records),
+            "truncated": sum(1 for r in records if r.truncated),
+        }
+
+    def cache_ratios(self) -> List[float]:
+        """Per-call share of prompt tokens served from the provider's prompt cache, in call order."""
+        with self._lock:
+            return [r.cache_ratio for r in self.records]
+
+    def per_agent(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            agents = list(dict.fromkeys(r.agent for r in self.records))
+        summary = {}
+        for agent in agents:
+            summary[agent] = {
+                **self.totals(agent),
+                "latency_p50": self.percentile("latency", 50, agent),
+                "latency_p95": self.percentile("latency", 95, agent),
+            }
+        return summary
+
+    def per_model(self) -> Dict[str, Dict[str, float]]:
+        """Totals and latency percentiles for each model that answered, to compare routing tiers."""
+        with self._lock:
+            by_model: Dict[str, List[CallRecord]] = {}
+            for r in self.records:
+                by_model.setdefault(r.model, []).append(r)
+        summary = {}
+        for model, records in by_model.items():
+            latencies = [r.latency for r in records]
+            summary[model] = {
+                "calls": len(records),
+                "agents": len({r.agent for r in records}),
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "prompt_tokens": sum(r.prompt_tokens for r in records),
+                "completion_tokens": sum(r.completion_tokens for r in records),
+                "cost": sum(r.cost for r in records),
+                "cost_per_call": sum(r.cost for r in records) / len(records),
+            }
+        return summary
+
+    def to_csv(self) -> str:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CallRecord.__slots__ + ("cache_ratio",))
+        with self._lock:
+            writer.writerows(r.as_row() + [round(r.cache_ratio, 4)] for r in self.records)
+        return buffer.getvalue()
@@ -0,0 +1,402 @@
+"""
+Call Resilience
+===============
+Deadlines, retries and hedged requests for chat model calls.
+
+Every model handed out by `clients.get_chat_model()` is wrapped in a
+ResilientModel, which routes `invoke()` and `stream()` through a
+ResiliencePolicy:
+
+    - each attempt has a deadline; a call still running past it is
+      abandoned (its result is discarded) and counts as a transient error
+    - rate-limit, timeout, connection and 5xx errors are retried with
+      jittered exponential backoff (via `tenacity`)
+    - optionally, an `invoke()` still running after the model's recent p95
+      latency is hedged: a duplicate request is sent and whichever answers
+      first wins
+
+Streams are retried only until their first chunk arrives and are never
+hedged, since chunks already shown cannot be taken back.
+
+Each attempt runs on a thread of its own rather than in a shared pool, so
+its deadline covers only the call itself (never time spent queued behind
+other calls), and an abandoned call ties up nothing that retries or other
+sessions need. Without a deadline or hedging, `invoke()` runs on the
+calling thread.
+
+`ainvoke()` and `astream()` apply the same policy on the event loop, with
+no worker threads; calls past their deadline and losing hedges are
+cancelled rather than abandoned.
+
+The process-wide default policy reads `DND_LLM_TIMEOUT` (seconds),
+`DND_LLM_MAX_ATTEMPTS` and `DND_LLM_HEDGE` (1 to enable hedging), and can
+be replaced with `configure_default()`.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+from metrics import percentile
+
+
+class DeadlineExceeded(TimeoutError):
+    """A model call did not finish within its policy's deadline."""
+
+
+# Sentinel marking the end of a stream handed between threads
+_END = object()
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for errors worth retrying: deadlines, rate limits, timeouts, connection and server errors."""
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import httpx
+        import openai
+    except ImportError:
+        return False
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    if isinstance(exc, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+class ResiliencePolicy:
+    """Deadline, retry and hedging settings, plus counters of what they did.
+
+    `timeout` is the deadline of each attempt in seconds (None for no
+    deadline). Hedging starts once `hedge_min_samples` successful calls of
+    a model have been seen, after max(`hedge_min_delay`, their
+    `hedge_percentile` latency).
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = 60.0,
+        max_attempts: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge: bool = False,
+        hedge_percentile: float = 95,
+        hedge_min_delay: float = 1.0,
+        hedge_min_samples: int = 5
+    ) -> None:
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = max(2, hedge_min_samples)
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=200))
+        self._stats = {"calls": 0, "retries": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+    def stats(self) -> Dict[str, int]:
+        """Calls made, retries, attempts that hit the deadline, hedges sent and won, and calls that failed."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def hedge_delay(self, model_name: str) -> Optional[float]:
+        """Seconds to wait before hedging a call to `model_name`, or None if it should not be hedged."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            samples = list(self._latencies[model_name])
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, percentile(samples, self.hedge_percentile))
+
+    def _retrying(self, asynchronous: bool = False):
+        from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+        def failed_attempt(retry_state) -> None:
+            self._count("retries")
+
+        return (AsyncRetrying if asynchronous else Retrying)(
+            stop=stop_after_attempt(self.max_attempts),
+            wait=wait_random_exponential(multiplier=self.backoff, max=self.backoff_max),
+            retry=retry_if_exception(is_transient),
+            before_sleep=failed_attempt,
+            reraise=True,
+        )
+
+    def invoke(self, model, messages: List, **kwargs: Any):
+        """`model.invoke(messages)` with deadlines, retries and (if enabled) hedging."""
+        self._count("calls")
+        try:
+            for attempt in self._retrying():
+                with attempt:
+                    return self._attempt(model, messages, kwargs)
+        except BaseException:
+            self._count("failures")
+            raise
+
+    def _attempt(self, model, messages: List, kwargs: Dict[str, Any]):
+        model_name = getattr(model, "model_name", None) or type(model).__name__
+        started = time.monotonic()
+        deadline = None if self.timeout is None else started + self.timeout
+        delay = self.hedge_delay(model_name)
+        if deadline is None and delay is None:
+            result = model.invoke(messages, **kwargs)
+            with self._lock:
+                self._latencies[model_name].append(time.monotonic() - started)
+            return result
+        primary = spawn(model.invoke, messages, **kwargs)
+        pending = {primary}
+        if delay is not None:
+            done, _ = wait(pending, timeout=_remaining(deadline, delay))
+            if not done and not _expired(deadline):
+                pending.add(spawn(model.invoke, messages, **kwargs))
+                self._count("hedges")
+
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, timeout=_remaining(deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                _abandon(pending)
+                self._count("timeouts")
+                raise DeadlineExceeded(f"{model_name} call exceeded {self.timeout:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    _abandon(pending)
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    with self._lock:
+                        self._latencies[model_name].append(time.monotonic() - started)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def ainvoke(self, model, messages: List, **kwargs: Any):
+        """`await model.ainvoke(messages)` with deadlines, retries and (if enabled) hedging."""
+        self._count("calls")
+        try:
+            async for attempt in self._retrying(asynchronous=True):
+                with attempt:
+                    return await self._aattempt(model, messages, kwargs)
+        except Exception:
+            self._count("failures")
+            raise
+
+    async def _aattempt(self, model, messages: List, kwargs: Dict[str, Any]):
+        model_name = getattr(model, "model_name", None) or type(model).__name__
+        started = time.monotonic()
+        deadline = None if self.timeout is None else started + self.timeout
+        primary = asyncio.ensure_future(model.ainvoke(messages, **kwargs))
+        pending = {primary}
+        delay = self.hedge_delay(model_name)
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=_remaining(deadline, delay))
+            if not done and not _expired(deadline):
+                pending.add(asyncio.ensure_future(model.ainvoke(messages, **kwargs)))
+                self._count("hedges")
+
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=_remaining(deadline), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self._count("timeouts")
+                    raise DeadlineExceeded(f"{model_name} call exceeded {self.timeout:.1f}s")
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            self._count("hedge_wins")
+                        with self._lock:
+                            self._latencies[model_name].append(time.monotonic() - started)
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def stream(self, model, messages: List, **kwargs: Any) -> Iterator:
+        """`model.stream(messages)`, retried until its first chunk and bounded by the deadline."""
+        self._count("calls")
+        try:
+            for attempt in self._retrying():
+                with attempt:
+                    chunks = self._open_stream(model, messages, kwargs)
+            yield from chunks
+        except BaseException:
+            self._count("failures")
+            raise
+
+    def _open_stream(self, model, messages: List, kwargs: Dict[str, Any]) -> Iterator:
+        """Start streaming on a worker thread; returns once the first chunk is in, so failures up to then can be retried."""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        chunks: "queue.Queue" = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce() -> None:
+            try:
+                for chunk in model.stream(messages, **kwargs):
+                    if cancelled.is_set():
+                        return
+                    chunks.put(chunk)
+                chunks.put(_END)
+            except BaseException as exc:
+                chunks.put(exc)
+
+        spawn(produce)
+
+        def take():
+            try:
+                item = chunks.get(timeout=_remaining(deadline))
+            except queue.Empty:
+                cancelled.set()
+                self._count("timeouts")
+                raise DeadlineExceeded(f"stream exceeded {self.timeout:.1f}s") from None
+            if isinstance(item, BaseException):
+                raise item
+            return item
+
+        first = take()
+
+        def rest() -> Iterator:
+            item = first
+            try:
+                while item is not _END:
+                    yield item
+                    item = take()
+            finally:
+                cancelled.set()
+
+        return rest()
+
+    async def astream(self, model, messages: List, **kwargs: Any) -> AsyncIterator:
+        """`model.astream(messages)`, retried until its first chunk and bounded by the deadline."""
+        self._count("calls")
+        try:
+            async for attempt in self._retrying(asynchronous=True):
+                with attempt:
+                    deadline = None if self.timeout is None else time.monotonic() + self.timeout
+                    chunks = model.astream(messages, **kwargs)
+                    try:
+                        item = await self._anext(chunks, deadline)
+                    except BaseException:
+                        await chunks.aclose()
+                        raise
+            try:
+                while item is not _END:
+                    yield item
+                    item = await self._anext(chunks, deadline)
+            finally:
+                await chunks.aclose()
+        except Exception:
+            self._count("failures")
+            raise
+
+    async def _anext(self, chunks: AsyncIterator, deadline: Optional[float]):
+        """The next chunk of `chunks` (or _END), raising DeadlineExceeded past the deadline."""
+        try:
+            return await asyncio.wait_for(chunks.__anext__(), _remaining(deadline))
+        except StopAsyncIteration:
+            return _END
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            raise DeadlineExceeded(f"stream exceeded {self.timeout:.1f}s") from None
+
+
+class ResilientModel:
+    """Chat model proxy whose `invoke()` and `stream()` (and async variants) go through a ResiliencePolicy.
+
+    Everything else (model name, temperature, ...) is read from the wrapped model.
+    """
+
+    def __init__(self, model, policy: ResiliencePolicy) -> None:
+        self.model = model
+        self.policy = policy
+
+    def invoke(self, messages: List, **kwargs: Any):
+        return self.policy.invoke(self.model, messages, **kwargs)
+
+    def stream(self, messages: List, **kwargs: Any) -> Iterator:
+        return self.policy.stream(self.model, messages, **kwargs)
+
+    async def ainvoke(self, messages: List, **kwargs: Any):
+        return await self.policy.ainvoke(self.model, messages, **kwargs)
+
+    def astream(self, messages: List, **kwargs: Any) -> AsyncIterator:
+        return self.policy.astream(self.model, messages, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.model, name)
+
+
+_default_policy: Optional[ResiliencePolicy] = None
+_default_lock = threading.Lock()
+
+
+def default_policy() -> ResiliencePolicy:
+    """The process-wide policy, created from the environment on first use."""
+    global _default_policy
+    with _default_lock:
+        if _default_policy is None:
+            timeout = float(os.environ.get("DND_LLM_TIMEOUT", 60))
+            _default_policy = ResiliencePolicy(
+                timeout=timeout if timeout > 0 else None,
+                max_attempts=int(os.environ.get("DND_LLM_MAX_ATTEMPTS", 3)),
+                hedge=os.environ.get("DND_LLM_HEDGE", "0") == "1",
+            )
+        return _default_policy
+
+
+def configure_default(**settings: Any) -> ResiliencePolicy:
+    """Replace the process-wide policy; models created from now on use the new one."""
+    global _default_policy
+    with _default_lock:
+        _default_policy = ResiliencePolicy(**settings)
+        return _default_policy
+
+
+def _remaining(deadline: Optional[float], cap: Optional[float] = None) -> Optional[float]:
+    if deadline is None:
+        return cap
+    remaining = max(0.0, deadline - time.monotonic())
+    return remaining if cap is None else min(cap, remaining)
+
+
+def _expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def spawn(fn, *args: Any, **kwargs: Any) -> Future:
+    """Run `fn` on a new daemon thread; returns a future of its result."""
+    future: Future = Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=run, name="llm-call", daemon=True).start()
+    return future
+
+
+def _abandon(futures) -> None:
+    # Calls already running cannot be interrupted; they finish on their own and are ignored
+    for future in futures:
+        future.cancel()
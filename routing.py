@@ -0,0 +1,318 @@
+"""
+Model Routing
+=============
+Which chat model (and settings) each role in a game uses.
+
+A RoutingConfig maps roles to ModelRoutes:
+
+    - "storyteller": the storyteller's turns
+    - "character": every character's turns
+    - "setup": character and storyteller descriptions
+    - "quest": the quest specification
+    - "summary": history summaries (HistoryCompactor)
+
+and can override the route of individual agents by name, e.g. to put the
+many short character turns on a small model while the storyteller keeps a
+stronger one. The default config reproduces the original behaviour: the
+default model everywhere, at temperature 0.2 for turns, 1.0 for setup and
+0.0 for summaries.
+
+A route with a `fallback` model and a `latency_budget` (seconds) answers
+from the fallback when the primary model is too slow: an `invoke()` still
+running after the budget is raced against the fallback, and a stream whose
+first chunk has not arrived by then is switched to whichever model starts
+first. The abandoned call finishes on its own and is ignored, as with
+hedged requests in `resilience`; in `ainvoke()` / `astream()` it is
+cancelled. Each call runs on a thread of its own, so the budget measures
+only the primary's own latency, never time spent queued behind other
+calls.
+
+Configs round-trip through plain dicts (`to_dict()` / `from_dict()`), so
+they can live in batch configs and snapshot headers.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from clients import get_chat_model
+from resilience import spawn
+
+
+ROLES = ("storyteller", "character", "setup", "quest", "summary")
+
+_stats_lock = threading.Lock()
+_stats = {"routed": 0, "fallbacks": 0, "fallback_wins": 0}
+
+
+def fallback_stats() -> Dict[str, int]:
+    """Process-wide counts of calls with a fallback, fallbacks sent and fallbacks that answered first."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class ModelRoute:
+    """One model choice: model name (None for the client default), temperature and optional fallback."""
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        temperature: float = 0.2,
+        fallback: Optional[str] = None,
+        latency_budget: Optional[float] = None
+    ) -> None:
+        self.model = model
+        self.temperature = temperature
+        self.fallback = fallback
+        self.latency_budget = latency_budget
+
+    def build(self, api_key: str, **kwargs):
+        """A chat model for this route, wrapped in a FallbackModel when a fallback is set."""
+        primary = get_chat_model(temperature=self.temperature, model=self.model, api_key=api_key, **kwargs)
+        if not self.fallback or self.latency_budget is None:
+            return primary
+        fallback = get_chat_model(temperature=self.temperature, model=self.fallback, api_key=api_key, **kwargs)
+        return FallbackModel(primary, fallback, self.latency_budget)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "fallback": self.fallback,
+            "latency_budget": self.latency_budget,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModelRoute":
+        return cls(
+            model=data.get("model"),
+            temperature=data.get("temperature", 0.2),
+            fallback=data.get("fallback"),
+            latency_budget=data.get("latency_budget"),
+        )
+
+    def __repr__(self) -> str:
+        return f"ModelRoute({self.to_dict()})"
+
+
+class RoutingConfig:
+    """Routes per role, plus per-agent overrides by name."""
+
+    def __init__(
+        self,
+        roles: Optional[Dict[str, ModelRoute]] = None,
+        agents: Optional[Dict[str, ModelRoute]] = None
+    ) -> None:
+        self.roles = {**default_roles(), **(roles or {})}
+        self.agents = dict(agents or {})
+        unknown = set(self.roles) - set(ROLES)
+        if unknown:
+            raise ValueError(f"Unknown routing roles: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    def uniform(cls, model: Optional[str] = None, temperature: float = 0.2) -> "RoutingConfig":
+        """Every game turn on `model` at `temperature`; setup and summaries keep their defaults on `model`."""
+        roles = default_roles()
+        for route in roles.values():
+            route.model = model
+        roles["storyteller"].temperature = roles["character"].temperature = temperature
+        return cls(roles)
+
+    def route(self, role: str, name: Optional[str] = None) -> ModelRoute:
+        """The route for agent `name` (if overridden), else for its role."""
+        if name is not None and name in self.agents:
+            return self.agents[name]
+        return self.roles[role]
+
+    def model_for(self, role: str, api_key: str, name: Optional[str] = None, **kwargs):
+        return self.route(role, name).build(api_key, **kwargs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "roles": {role: route.to_dict() for role, route in self.roles.items()},
+            "agents": {name: route.to_dict() for name, route in self.agents.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "RoutingConfig":
+        data = data or {}
+        return cls(
+            {role: ModelRoute.from_dict(route) for role, route in data.get("roles", {}).items()},
+            {name: ModelRoute.from_dict(route) for name, route in data.get("agents", {}).items()},
+        )
+
+
+def default_roles() -> Dict[str, ModelRoute]:
+    return {
+        "storyteller": ModelRoute(temperature=0.2),
+        "character": ModelRoute(temperature=0.2),
+        "setup": ModelRoute(temperature=1.0),
+        "quest": ModelRoute(temperature=1.0),
+        "summary": ModelRoute(temperature=0.0),
+    }
+
+
+class FallbackModel:
+    """Chat model proxy that answers from `fallback` when `primary` exceeds `latency_budget` seconds.
+
+    Everything else (temperature, ...) is read from the primary model;
+    `model_name` stays the primary's, and `served_model_name` names the
+    model that answered this thread's last call.
+    """
+
+    def __init__(self, primary, fallback, latency_budget: float) -> None:
+        self.primary = primary
+        self.fallback = fallback
+        self.latency_budget = latency_budget
+        self._served = threading.local()
+
+    @property
+    def served_model_name(self) -> Optional[str]:
+        return getattr(self._served, "name", None) or _name(self.primary)
+
+    def invoke(self, messages: List, **kwargs: Any):
+        _count("routed")
+        pending = {spawn(self.primary.invoke, messages, **kwargs)}
+        done, _ = wait(pending, timeout=self.latency_budget)
+        if done:
+            return self._served_by(self.primary, pending.pop().result())
+        backup = spawn(self.fallback.invoke, messages, **kwargs)
+        _count("fallbacks")
+        pending.add(backup)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        _count("fallback_wins")
+                    return self._served_by(self.fallback if future is backup else self.primary, future.result())
+                error = future.exception()
+        raise error
+
+    def stream(self, messages: List, **kwargs: Any) -> Iterator:
+        _count("routed")
+        primary = spawn(_open, self.primary, messages, kwargs)
+        done, _ = wait({primary}, timeout=self.latency_budget)
+        if done:
+            return self._stream_from(self.primary, primary.result())
+        backup = spawn(_open, self.fallback, messages, kwargs)
+        _count("fallbacks")
+        pending = {primary, backup}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        _count("fallback_wins")
+                    return self._stream_from(self.fallback if future is backup else self.primary, future.result())
+                error = future.exception()
+        raise error
+
+    async def ainvoke(self, messages: List, **kwargs: Any):
+        _count("routed")
+        primary = asyncio.ensure_future(self.primary.ainvoke(messages, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=self.latency_budget)
+        if done:
+            return self._served_by(self.primary, primary.result())
+        backup = asyncio.ensure_future(self.fallback.ainvoke(messages, **kwargs))
+        _count("fallbacks")
+        pending = {primary, backup}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is backup:
+                            _count("fallback_wins")
+                        return self._served_by(self.fallback if future is backup else self.primary, future.result())
+                    error = future.exception()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def astream(self, messages: List, **kwargs: Any) -> AsyncIterator:
+        _count("routed")
+        primary = asyncio.ensure_future(_aopen(self.primary, messages, kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=self.latency_budget)
+        winner = primary if done else None
+        if winner is None:
+            backup = asyncio.ensure_future(_aopen(self.fallback, messages, kwargs))
+            _count("fallbacks")
+            pending = {primary, backup}
+            error: Optional[BaseException] = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None and winner is None:
+                        winner = future
+                    elif future.exception() is None:
+                        await future.result()[1].aclose()
+                    else:
+                        error = future.exception()
+            for future in pending:
+                future.cancel()
+            if winner is None:
+                raise error
+            if winner is backup:
+                _count("fallback_wins")
+        first, chunks = winner.result()
+        self._served.name = _name(self.primary if winner is primary else self.fallback)
+        try:
+            if first is not _EMPTY:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            await chunks.aclose()
+
+    def _served_by(self, model, message):
+        self._served.name = _name(model)
+        return message
+
+    def _stream_from(self, model, opened) -> Iterator:
+        first, chunks = opened
+        self._served.name = _name(model)
+        if first is _EMPTY:
+            return iter(())
+        return _chain(first, chunks)
+
+    def __getattr__(self, name: str):
+        return getattr(self.primary, name)
+
+
+# Marks a stream that ended before its first chunk
+_EMPTY = object()
+
+
+def _open(model, messages: List, kwargs: Dict[str, Any]):
+    """Start `model.stream()` and wait for its first chunk; returns (first chunk, rest of the stream)."""
+    chunks = iter(model.stream(messages, **kwargs))
+    return next(chunks, _EMPTY), chunks
+
+
+async def _aopen(model, messages: List, kwargs: Dict[str, Any]):
+    """Async `_open`: start `model.astream()` and wait for its first chunk."""
+    chunks = model.astream(messages, **kwargs)
+    try:
+        return await chunks.__anext__(), chunks
+    except StopAsyncIteration:
+        return _EMPTY, chunks
+
+
+def _chain(first, chunks: Iterator) -> Iterator:
+    yield first
+    yield from chunks
+
+
+def _name(model) -> Optional[str]:
+    return getattr(model, "model_name", None) or type(model).__name__
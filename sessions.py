@@ -0,0 +1,272 @@
+"""
+Session Manager
+===============
+Process-wide registry of live games, one per browser session.
+
+Games are held here rather than in `st.session_state`, so their memory can
+be reclaimed. Games idle for longer than `idle_timeout`, games over the
+per-session budget that are not in use, and the least recently used games
+while the process is over its global budget are moved to disk as snapshots.
+A game moved to disk is rebuilt from its snapshot, with zero API calls, the
+next time its session asks for it, and forgotten after `forget_after`.
+Games that are not being saved are moved to a private directory
+(`DND_SPILL_DIR`, or a temporary directory removed at exit), never to the
+saved games that every session can list and resume.
+
+Budgets default to the environment variables `DND_SESSION_BUDGET_MB`,
+`DND_GLOBAL_BUDGET_MB` and `DND_IDLE_TIMEOUT` (seconds). The app uses the
+process-wide manager from `default_manager()`.
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from engine import AutoPlayer, DialogueSimulator
+from snapshot import (
+    load_snapshot,
+    new_snapshot_path,
+    restore_simulator,
+    save_snapshot,
+    unwatch_snapshot,
+    watch_snapshot,
+)
+
+
+MB = 2**20
+# Rough per-object overheads, in bytes, for the memory estimate
+_TURN_OVERHEAD = 120
+_RECORD_OVERHEAD = 160
+
+_spill_dir: Optional[str] = None
+_spill_lock = threading.Lock()
+
+
+def spill_dir() -> str:
+    """Private directory for snapshots of unsaved games moved to disk, created on first use."""
+    global _spill_dir
+    with _spill_lock:
+        if _spill_dir is None:
+            _spill_dir = os.environ.get("DND_SPILL_DIR")
+            if _spill_dir:
+                os.makedirs(_spill_dir, mode=0o700, exist_ok=True)
+            else:
+                _spill_dir = tempfile.mkdtemp(prefix="dnd-spill-")
+                atexit.register(shutil.rmtree, _spill_dir, ignore_errors=True)
+        return _spill_dir
+
+
+class GameSession:
+    """Everything one live game keeps in memory, plus what is needed to restore it."""
+
+    def __init__(
+        self,
+        simulator: DialogueSimulator,
+        header: Dict,
+        snapshot_path: Optional[str],
+        restore_options: Dict
+    ) -> None:
+        self.simulator: Optional[DialogueSimulator] = simulator
+        self.header = header
+        self.snapshot_path = snapshot_path
+        self.owns_snapshot = False
+        self.restore_options = restore_options
+        self.log_html: List[str] = []
+        self.autoplayer: Optional[AutoPlayer] = None
+        self.last_active = time.monotonic()
+        self.spilled = False
+        self._bytes = 0
+        self._counted = (0, 0, 0)
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        """True while auto-play is running; a paused auto-player does not keep a game in memory."""
+        return self.autoplayer is not None and self.autoplayer.alive and not self.autoplayer.paused
+
+    def memory_bytes(self) -> int:
+        """Estimated bytes held by the transcript, rendered HTML, usage records and retrieval memory.
+
+        Updated incrementally, since the first three only grow.
+        """
+        if self.simulator is None:
+            return 0
+        turns = self.simulator.transcript.turns
+        records = self.simulator.ledger.records
+        counted_turns, counted_html, counted_records = self._counted
+        if counted_turns > len(turns):
+            self._bytes, self._counted = 0, (0, 0, 0)
+            counted_turns, counted_html, counted_records = 0, 0, 0
+        # Each turn's text is held by the turn and by its two shared chat message forms
+        for turn in turns[counted_turns:]:
+            self._bytes += 3 * (sys.getsizeof(turn.message) + _TURN_OVERHEAD)
+        for html in self.log_html[counted_html:]:
+            self._bytes += sys.getsizeof(html)
+        self._bytes += (len(records) - counted_records) * _RECORD_OVERHEAD
+        self._counted = (len(turns), len(self.log_html), len(records))
+        memory = self.simulator.memory
+        return self._bytes + (memory.nbytes if memory is not None else 0)
+
+
+class SessionManager:
+    """Tracks live games, enforces memory budgets and moves idle games to disk."""
+
+    def __init__(
+        self,
+        idle_timeout: float = float(os.environ.get("DND_IDLE_TIMEOUT", 900)),
+        session_budget_bytes: int = int(float(os.environ.get("DND_SESSION_BUDGET_MB", 32)) * MB),
+        global_budget_bytes: int = int(float(os.environ.get("DND_GLOBAL_BUDGET_MB", 512)) * MB),
+        session_grace: float = 30.0,
+        forget_after: float = 24 * 3600,
+        sweep_interval: float = 1.0
+    ) -> None:
+        self.idle_timeout = idle_timeout
+        self.session_budget_bytes = session_budget_bytes
+        self.global_budget_bytes = global_budget_bytes
+        self.session_grace = session_grace
+        self.forget_after = forget_after
+        self.sweep_interval = sweep_interval
+        self._lock = threading.RLock()
+        self._sessions: Dict[str, GameSession] = {}
+        self._last_sweep = 0.0
+        self.spill_count = 0
+        self.restore_count = 0
+
+    def register(
+        self,
+        session_id: str,
+        simulator: DialogueSimulator,
+        header: Dict,
+        snapshot_path: Optional[str] = None,
+        **restore_options
+    ) -> GameSession:
+        """Make `simulator` the live game of `session_id`, replacing any previous one.
+
+        `restore_options` (e.g. `compact_every`, `prefetch`) are passed to
+        `restore_simulator` when the game comes back from disk.
+        """
+        self.drop(session_id)
+        session = GameSession(simulator, header, snapshot_path, restore_options)
+        with self._lock:
+            self._sessions[session_id] = session
+        self.sweep()
+        return session
+
+    def get(self, session_id: str, api_key: str) -> Optional[GameSession]:
+        """Return the session's game, restoring it from disk if it was moved there."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.touch()
+            if session.spilled:
+                self._restore(session, api_key)
+        self.sweep()
+        return session
+
+    def drop(self, session_id: str) -> None:
+        """Forget a session's game, stopping its background work."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        if session.autoplayer is not None:
+            session.autoplayer.stop()
+        if session.simulator is not None:
+            session.simulator.cancel_prefetch()
+            unwatch_snapshot(session.simulator)
+        if session.owns_snapshot and session.snapshot_path and os.path.exists(session.snapshot_path):
+            os.remove(session.snapshot_path)
+
+    def sweep(self, force: bool = False) -> None:
+        """Move idle, oversized and (while over the global budget) least recently used games to disk.
+
+        Games left on disk for longer than `forget_after` (e.g. after the
+        browser tab was closed) are forgotten; saved games stay listed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+            forgotten = [
+                session_id for session_id, session in self._sessions.items()
+                if session.spilled and now - session.last_active > self.forget_after
+            ]
+            live = [s for s in self._sessions.values() if not s.spilled and not s.busy]
+            for session in live:
+                idle = now - session.last_active
+                if idle > self.idle_timeout or (
+                    idle > self.session_grace and session.memory_bytes() > self.session_budget_bytes
+                ):
+                    self._spill(session)
+            total = self.memory_bytes()
+            for session in sorted(live, key=lambda s: s.last_active):
+                if total <= self.global_budget_bytes:
+                    break
+                if not session.spilled:
+                    total -= session.memory_bytes()
+                    self._spill(session)
+        for session_id in forgotten:
+            self.drop(session_id)
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(session.memory_bytes() for session in self._sessions.values())
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            return {
+                "active": sum(1 for s in sessions if not s.spilled),
+                "on_disk": sum(1 for s in sessions if s.spilled),
+                "memory_mb": sum(s.memory_bytes() for s in sessions) / MB,
+                "spills": self.spill_count,
+                "restores": self.restore_count,
+            }
+
+    def _spill(self, session: GameSession) -> None:
+        # Caller holds _lock
+        simulator = session.simulator
+        if session.autoplayer is not None:
+            session.autoplayer.stop()
+        simulator.cancel_prefetch()
+        if session.snapshot_path is None:
+            session.snapshot_path = new_snapshot_path(spill_dir())
+            session.owns_snapshot = True
+            save_snapshot(session.snapshot_path, simulator, session.header)
+        # A turn still finishing must not append after the game was spilled (or, later, dropped)
+        unwatch_snapshot(simulator)
+        session.simulator = None
+        session.autoplayer = None
+        session.log_html = []
+        session.spilled = True
+        self.spill_count += 1
+
+    def _restore(self, session: GameSession, api_key: str) -> None:
+        # Caller holds _lock
+        header, turns = load_snapshot(session.snapshot_path)
+        session.simulator = restore_simulator(header, turns, api_key, **session.restore_options)
+        watch_snapshot(session.snapshot_path, session.simulator)
+        session.spilled = False
+        self.restore_count += 1
+
+
+_default_manager: Optional[SessionManager] = None
+_default_lock = threading.Lock()
+
+
+def default_manager() -> SessionManager:
+    """The process-wide manager, shared by every browser session (and by tools such as the load test)."""
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = SessionManager()
+        return _default_manager
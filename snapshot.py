@@ -0,0 +1,230 @@
+"""
+Game Snapshots
+==============
+Save games to disk after every turn and resume them with zero API calls.
+
+A snapshot is a JSON Lines file. The first line is a header holding the
+roster, descriptions, quest, system prompts and model routing. Every
+following line is one committed turn, `{"s": speaker, "m": message}`, and
+is appended as soon as the turn is committed, so saving never rewrites the
+whole transcript. Resuming reads the file once and bulk-loads the turns
+into a fresh simulator.
+
+A resumed game is forked into a new snapshot (`fork_snapshot()`), so two
+sessions resuming the same save never append to one file.
+
+Appends never create the file: a turn committed after a snapshot was
+deleted (e.g. by an auto-play turn still running during a reset) is
+dropped rather than left in a new file without a header.
+"""
+
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from engine import DialogueSimulator, Turn, assemble_simulator
+from routing import RoutingConfig
+
+
+SNAPSHOT_VERSION = 1
+DEFAULT_SAVE_DIR = os.environ.get("DND_SAVE_DIR", ".dnd_saves")
+# Header keys every snapshot must have to be listed and resumed
+HEADER_KEYS = (
+    "created",
+    "storyteller_name",
+    "character_names",
+    "character_descriptions",
+    "quest",
+    "specified_quest",
+    "max_iterations",
+    "system_messages",
+    "model",
+)
+
+
+class SnapshotWriter:
+    """Appends each committed turn of a simulator to its snapshot file, until closed or the file is gone."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+    def __call__(self, turn: Turn) -> None:
+        if self.closed:
+            return
+        line = json.dumps({"s": turn.speaker, "m": turn.message}, ensure_ascii=False, separators=(",", ":"))
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            self.closed = True
+            return
+        with open(fd, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def new_snapshot_path(directory: str = DEFAULT_SAVE_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl")
+
+
+def build_header(
+    simulator: DialogueSimulator,
+    character_descriptions: Dict[str, str],
+    quest: str,
+    specified_quest: str,
+    word_limit: int,
+    max_iterations: int
+) -> Dict:
+    """Describe everything needed to rebuild `simulator` without calling the model."""
+    storyteller = simulator.agents[0]
+    model = storyteller.model
+    return {
+        "version": SNAPSHOT_VERSION,
+        "created": time.time(),
+        "storyteller_name": storyteller.name,
+        "character_names": [agent.name for agent in simulator.agents[1:]],
+        "character_descriptions": character_descriptions,
+        "quest": quest,
+        "specified_quest": specified_quest,
+        "word_limit": word_limit,
+        "max_iterations": max_iterations,
+        "simultaneous": simulator.simultaneous,
+        "system_messages": [[agent.name, agent.system_message.content] for agent in simulator.agents],
+        "model": {
+            "model": getattr(model, "model_name", None),
+            "temperature": getattr(model, "temperature", 0.2),
+        },
+        "routing": simulator.routing.to_dict() if simulator.routing is not None else None,
+    }
+
+
+def save_snapshot(path: str, simulator: DialogueSimulator, header: Dict) -> SnapshotWriter:
+    """Write the header and current transcript, then keep the file updated after each turn.
+
+    The initial write goes through a temporary file, so an existing snapshot
+    is never left half-written.
+    """
+    lines = [json.dumps(header, ensure_ascii=False, separators=(",", ":"))]
+    lines += [
+        json.dumps({"s": turn.speaker, "m": turn.message}, ensure_ascii=False, separators=(",", ":"))
+        for turn in simulator.transcript
+    ]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+    return watch_snapshot(path, simulator)
+
+
+def fork_snapshot(simulator: DialogueSimulator, header: Dict, source: str, directory: str = DEFAULT_SAVE_DIR) -> str:
+    """Save a game resumed from the snapshot at `source` as a new snapshot, kept updated from now on.
+
+    Returns the new path. The source file is left as it is, for whichever
+    session may still be writing it.
+    """
+    path = new_snapshot_path(directory)
+    save_snapshot(path, simulator, {**header, "created": time.time(), "forked_from": os.path.basename(source)})
+    return path
+
+
+def watch_snapshot(path: str, simulator: DialogueSimulator) -> SnapshotWriter:
+    """Append every turn `simulator` commits from now on to the snapshot at `path`."""
+    writer = SnapshotWriter(path)
+    simulator.add_listener(writer)
+    return writer
+
+
+def unwatch_snapshot(simulator: DialogueSimulator) -> None:
+    """Stop appending `simulator`'s turns to any snapshot file."""
+    for listener in simulator.listeners:
+        if isinstance(listener, SnapshotWriter):
+            listener.close()
+            simulator.remove_listener(listener)
+
+
+def read_header(path: str) -> Dict:
+    """The header of the snapshot at `path`; raises ValueError if it is not a supported snapshot header."""
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+    if not isinstance(header, dict) or header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} has no supported snapshot header")
+    missing = [key for key in HEADER_KEYS if key not in header]
+    if missing:
+        raise ValueError(f"{path} header lacks {', '.join(missing)}")
+    return header
+
+
+def load_snapshot(path: str) -> Tuple[Dict, List[Tuple[str, str]]]:
+    """Return (header, turns) from a snapshot file.
+
+    A partially written last line (e.g. after a crash mid-append) is ignored.
+    """
+    header = read_header(path)
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    turns = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            break
+        turns.append((record["s"], record["m"]))
+    return header, turns
+
+
+def restore_simulator(
+    header: Dict,
+    turns: List[Tuple[str, str]],
+    api_key: str,
+    compact_every: Optional[int] = None,
+    prefetch: bool = False,
+    memory_top_k: Optional[int] = None
+) -> DialogueSimulator:
+    """Rebuild a simulator from a snapshot; no LLM calls are made (unless `prefetch` is on).
+
+    With `memory_top_k`, the retrieval memory is rebuilt from the restored
+    turns on the first prompt.
+    """
+    from langchain_core.messages import SystemMessage
+
+    simulator = assemble_simulator(
+        [(name, SystemMessage(content=content)) for name, content in header["system_messages"]],
+        api_key,
+        model=header["model"].get("model"),
+        temperature=header["model"].get("temperature", 0.2),
+        compact_every=compact_every,
+        prefetch=prefetch,
+        simultaneous=header.get("simultaneous", False),
+        word_limit=header.get("word_limit"),
+        memory_top_k=memory_top_k,
+        routing=RoutingConfig.from_dict(header["routing"]) if header.get("routing") else None,
+    )
+    simulator.restore(turns)
+    # The quest opens the transcript; `max_iterations` turns follow it
+    simulator.max_turns = header["max_iterations"] + 1
+    if prefetch:
+        simulator.prefetch()
+    return simulator
+
+
+def list_snapshots(directory: str = DEFAULT_SAVE_DIR) -> List[Tuple[str, Dict]]:
+    """Return (path, header) for every readable snapshot, most recently updated first."""
+    if not os.path.isdir(directory):
+        return []
+    paths = [
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")
+    ]
+    snapshots = []
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            snapshots.append((path, read_header(path)))
+        except (OSError, ValueError):
+            continue
+    return snapshots
@@ -0,0 +1,104 @@
+"""
+Multi-Agent D&D Game - Startup Report
+=====================================
+Measures cold-start cost so first paint and per-rerun time stay in budget:
+
+    - import-time breakdown of `dnd.py`, grouped by top-level package
+      (from `python -X importtime` in a fresh interpreter)
+    - the first script run (landing page) and a rerun, via Streamlit's AppTest
+
+Exits non-zero when a budget is exceeded, so it can gate CI.
+
+Run:
+    python startup_report.py
+    python startup_report.py --import-budget-ms 800 --rerun-budget-ms 100 --top 15
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_breakdown(module: str = "dnd") -> Tuple[float, Dict[str, float], List[str]]:
+    """Import `module` in a fresh interpreter.
+
+    Returns its cumulative import time in ms, self time in ms per top-level
+    package, and the heavy LLM packages that were loaded.
+    """
+    probe = (
+        f"import sys, {module}; "
+        "print(','.join(m for m in ('langchain_openai', 'langchain_core', 'openai', 'httpx') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=APP_DIR, capture_output=True, text=True, check=True,
+    )
+    per_package: Dict[str, float] = defaultdict(float)
+    total = 0.0
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        per_package[name.split(".")[0]] += int(self_us) / 1000
+        if name == module:
+            total = int(cumulative_us) / 1000
+    heavy = [name for name in result.stdout.strip().split(",") if name]
+    return total, dict(per_package), heavy
+
+
+def script_run_times(script: str = "dnd.py") -> Tuple[float, float]:
+    """Time the first run and a rerun of the app's landing page, in ms."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(APP_DIR, script), default_timeout=60)
+    started = time.perf_counter()
+    app.run()
+    first = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    app.run()
+    rerun = (time.perf_counter() - started) * 1000
+    return first, rerun
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Report import and first-run time of the app.")
+    parser.add_argument("--top", type=int, default=10, help="Number of packages to list")
+    parser.add_argument("--import-budget-ms", type=float, default=None)
+    parser.add_argument("--first-run-budget-ms", type=float, default=None)
+    parser.add_argument("--rerun-budget-ms", type=float, default=None)
+    parser.add_argument("--skip-app", action="store_true", help="Only measure imports")
+    args = parser.parse_args(argv)
+
+    total, per_package, heavy = import_breakdown()
+    print(f"import dnd: {total:.1f} ms")
+    for name, ms in sorted(per_package.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {name:<28} {ms:8.1f} ms")
+    print(f"LLM packages loaded at import: {', '.join(heavy) or 'none'}")
+
+    checks = [("import", total, args.import_budget_ms)]
+    if not args.skip_app:
+        first, rerun = script_run_times()
+        print(f"first run (landing page): {first:.1f} ms")
+        print(f"rerun: {rerun:.1f} ms")
+        checks += [("first run", first, args.first_run_budget_ms), ("rerun", rerun, args.rerun_budget_ms)]
+
+    failed = False
+    for label, value, budget in checks:
+        if budget is not None and value > budget:
+            print(f"OVER BUDGET: {label} {value:.1f} ms > {budget:.1f} ms")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import json
+import os
+
+import pytest
+
+from engine import create_simulator
+from routing import RoutingConfig
+from snapshot import (
+    build_header,
+    fork_snapshot,
+    list_snapshots,
+    load_snapshot,
+    new_snapshot_path,
+    read_header,
+    restore_simulator,
+    save_snapshot,
+    unwatch_snapshot,
+)
+
+
+NAMES = ["Harry Potter", "Ron Weasley"]
+DESCRIPTIONS = {"Harry Potter": "You are brave.", "Ron Weasley": "You are loyal."}
+
+
+@pytest.fixture
+def simulator():
+    simulator = create_simulator(
+        NAMES,
+        DESCRIPTIONS,
+        "Dungeon Master",
+        "You narrate.",
+        "A game of wizards.",
+        "Find the golden key.",
+        20,
+        "sk-test",
+        routing=RoutingConfig.uniform("fake"),
+    )
+    simulator.advance()
+    return simulator
+
+
+def _header(simulator):
+    return build_header(simulator, DESCRIPTIONS, "Find the key.", "Find the golden key.", 20, 10)
+
+
+def _turns(simulator):
+    return [(turn.speaker, turn.message) for turn in simulator.transcript]
+
+
+def test_save_then_load_round_trips(simulator, tmp_path):
+    path = new_snapshot_path(str(tmp_path))
+    header = _header(simulator)
+    save_snapshot(path, simulator, header)
+
+    loaded_header, turns = load_snapshot(path)
+
+    assert loaded_header == json.loads(json.dumps(header))
+    assert turns == _turns(simulator)
+
+
+def test_turns_committed_after_saving_are_appended(simulator, tmp_path):
+    path = new_snapshot_path(str(tmp_path))
+    save_snapshot(path, simulator, _header(simulator))
+
+    simulator.inject("Player", "I light a torch.")
+    simulator.advance()
+
+    _, turns = load_snapshot(path)
+    assert turns == _turns(simulator)
+    assert ("Player", "I light a torch.") in turns
+
+
+def test_restore_rebuilds_the_game(simulator, tmp_path):
+    path = new_snapshot_path(str(tmp_path))
+    save_snapshot(path, simulator, _header(simulator))
+
+    restored = restore_simulator(*load_snapshot(path), api_key="sk-test")
+
+    assert _turns(restored) == _turns(simulator)
+    assert [agent.name for agent in restored.agents] == [agent.name for agent in simulator.agents]
+    assert [agent.system_message.content for agent in restored.agents] == [
+        agent.system_message.content for agent in simulator.agents
+    ]
+    assert restored.routing.to_dict() == simulator.routing.to_dict()
+    assert restored.next_speaker.name == simulator.next_speaker.name
+
+
+def test_partial_last_line_is_ignored(simulator, tmp_path):
+    path = new_snapshot_path(str(tmp_path))
+    save_snapshot(path, simulator, _header(simulator))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"s": "Harry Potter", "m": "I op')
+
+    _, turns = load_snapshot(path)
+    assert turns == _turns(simulator)
+
+
+def test_turns_after_deletion_do_not_recreate_the_file(simulator, tmp_path):
+    path = new_snapshot_path(str(tmp_path))
+    save_snapshot(path, simulator, _header(simulator))
+    os.remove(path)
+
+    simulator.inject("Player", "Anyone there?")
+
+    assert not os.path.exists(path)
+
+
+def test_unwatched_simulator_stops_appending(simulator, tmp_path):
+    path = new_snapshot_path(str(tmp_path))
+    save_snapshot(path, simulator, _header(simulator))
+    saved = _turns(simulator)
+
+    unwatch_snapshot(simulator)
+    simulator.inject("Player", "Anyone there?")
+
+    assert load_snapshot(path)[1] == saved
+
+
+def test_list_snapshots_skips_files_without_a_valid_header(simulator, tmp_path):
+    path = new_snapshot_path(str(tmp_path))
+    save_snapshot(path, simulator, _header(simulator))
+    (tmp_path / "headerless.jsonl").write_text('{"s":"Harry Potter","m":"Hello"}\n', encoding="utf-8")
+    (tmp_path / "future.jsonl").write_text(json.dumps({**_header(simulator), "version": 99}) + "\n")
+    (tmp_path / "empty.jsonl").write_text("", encoding="utf-8")
+
+    assert [listed for listed, _ in list_snapshots(str(tmp_path))] == [path]
+    with pytest.raises(ValueError):
+        read_header(str(tmp_path / "headerless.jsonl"))
+
+
+def test_fork_leaves_the_source_to_its_writer(simulator, tmp_path):
+    source = new_snapshot_path(str(tmp_path))
+    save_snapshot(source, simulator, _header(simulator))
+    header, turns = load_snapshot(source)
+
+    resumed = restore_simulator(header, turns, api_key="sk-test")
+    fork = fork_snapshot(resumed, header, source, str(tmp_path))
+    resumed.inject("Player", "I take the other path.")
+    simulator.inject("Player", "I stay here.")
+
+    assert fork != source
+    assert load_snapshot(fork)[1] == _turns(resumed)
+    assert load_snapshot(source)[1] == _turns(simulator)
+    assert read_header(fork)["forked_from"] == os.path.basename(source)